@@ -5,28 +5,31 @@ sys.path.append('../../lib/')
 from kernel import VectorSampling
 from utils import target_function
 
-np.random.seed(42)
 dim = 3
 print("simple MCMC")
 n_samples = 10**4
-for i in range(8):
-    beta_k = [1]
-    init = [(-1)**(i//4),(-1)**((i//4)//2),(-1)**(i%2)]
-    print(init)
-    sp = VectorSampling(
-        dimention=dim,
-        log_likelifood_function=target_function,
-        beta_k=beta_k,
-        eps_j_k=[[1 for _ in range(dim)] for _k in beta_k],
-        exchange_step=10**4,
-        prior_center=[0 for _ in range(dim)],
-        prior_width=[10 for _ in range(dim)],
-        init=[
-            {f"x_{i}": x_i for i,x_i in enumerate(init)}
-            for _k in beta_k]
-    )
-    sp.sampling(n_samples)
-    sp.save("test_mhmcmc.bin", timestamp=True)
+n_chain = 8
+beta_k = [1]
+init_c = [[(-1)**(c//4),(-1)**((c//4)//2),(-1)**(c%2)] for c in range(n_chain)]
+print(init_c)
+sp = VectorSampling(
+    dimention=dim,
+    log_likelifood_function=target_function,
+    beta_k=beta_k,
+    eps_j_k=[[1 for _ in range(dim)] for _k in beta_k],
+    exchange_step=10**4,
+    prior_center=[0 for _ in range(dim)],
+    prior_width=[10 for _ in range(dim)],
+    init=[
+        [{f"x_{i}": x_i for i,x_i in enumerate(init)} for _k in beta_k]
+        for init in init_c],
+    engine="numba",
+    n_chain=n_chain,
+    random_state=42
+)
+sp.sampling(n_samples)
+print("R-hat:", sp.rhat(burnin=5000)[0])
+sp.save("test_mhmcmc.bin", timestamp=True)
 
 print("Replica exchange MCMC")
 beta_k = np.logspace(-5, 5, 21)
@@ -43,7 +46,12 @@ sp = VectorSampling(
     prior_width=[10 for _ in range(dim)],
     init=[
         {f"x_{i}": x_i for i,x_i in enumerate(init)}
-        for _k in beta_k]
+        for _k in beta_k],
+    random_state=42
 )
-sp.sampling(n_samples)
+# the log-spaced betas and eps are only the starting point, tuned in the first fifth of the run
+sp.sampling(n_samples, tune=n_samples // 5, tune_ladder=True)
+print("tuned beta:", sp.beta_k)
+print("tuned eps:", sp.eps_j_k[:, 0])
+print("betas for swap rate 0.3:", sp.suggest_n_beta(0.3))
 sp.save("test_remcmc.bin", timestamp=True)
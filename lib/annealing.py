@@ -0,0 +1,234 @@
+import numpy as np
+
+
+def logsumexp(a_i):
+    """log of the sum of exp, without overflow"""
+    a_max = np.max(a_i)
+    if not np.isfinite(a_max):
+        return a_max
+    return a_max + np.log(np.sum(np.exp(a_i - a_max)))
+
+
+class PopulationAnnealing(object):
+    """
+    population annealing (sequential Monte Carlo) with the model of a replica exchange sampler
+
+    A population of particles is carried from the first to the last beta of the ladder.
+    At each beta, the particles are reweighted by `exp((beta_new - beta) * lcp)`,
+    resampled when the effective sample size falls below `resample_threshold`,
+    and moved by `n_sweep` Metropolis-Hastings sweeps of the blocks of the sampler.
+    All particles are updated at once by `log_condprob_batch` and `log_priorprob_batch`,
+    so that a batched (numpy or njit) likelihood makes 10^5 particles practical.
+
+    The mean weights give `log Z(beta_l) - log Z(beta_0)` of the normalizing constants
+    `Z(beta) = int exp(beta * lcp + lpp)` as a byproduct, which is the log evidence
+    when beta_0 = 0 and the prior is normalized.
+    """
+    def __init__(
+        self, sampler, param_init_j_i, n_sweep=1, resample_threshold=0.5,
+        beta_l=None, random_state=None
+    ):
+        """
+        Parameters
+        ----------
+        sampler: ReplicaExchangeBase
+            sampler giving the model (`log_condprob_batch`, `log_priorprob_batch`),
+            the blocks of the update, the ladder `beta_k` and the step widths `eps_j_k`
+            of its first chain
+        param_init_j_i: np.ndarray (I, J)
+            initial particles, drawn from the distribution at the first beta,
+            e.g. from the prior when it is 0
+        n_sweep: int, default=1
+            number of Metropolis-Hastings sweeps at each beta
+        resample_threshold: float, default=0.5
+            particles are resampled when the effective sample size is below
+            `resample_threshold * I`, 1 resamples at every beta
+        beta_l: list[float], optional
+            ladder to anneal along instead of the ladder of `sampler`,
+            whose `eps_j_k` is interpolated to it in log-log scale
+        random_state: int|np.random.SeedSequence, optional
+            seed of the random number generator
+        """
+        if int(n_sweep) != n_sweep or n_sweep < 0:
+            raise ValueError(
+                f"n_sweep must be a non-negative integer but this is {n_sweep}"
+            )
+        if not 0 <= resample_threshold <= 1:
+            raise ValueError(
+                f"resample_threshold must be in [0, 1] but this is {resample_threshold}"
+            )
+        self.sampler = sampler
+        self.n_sweep = int(n_sweep)
+        self.resample_threshold = resample_threshold
+        beta_k = np.asarray(sampler.beta_k, dtype=np.float64)[:sampler.n_beta]
+        eps_j_k = np.asarray(sampler.eps_j_k, dtype=np.float64)[:sampler.n_beta]
+        if beta_l is None:
+            self.beta_l = beta_k
+            self.eps_j_l = eps_j_k
+        else:
+            self.beta_l = np.asarray(beta_l, dtype=np.float64)
+            # in log-log scale as `adapt_ladder`, or log(eps) in beta if some beta is not positive
+            log_scale = (beta_k > 0).all() and (self.beta_l > 0).all()
+            x_k = np.log(beta_k) if log_scale else beta_k
+            x_l = np.log(self.beta_l) if log_scale else self.beta_l
+            order_k = np.argsort(x_k)
+            self.eps_j_l = np.exp(np.stack([
+                np.interp(x_l, x_k[order_k], np.log(eps_k[order_k]))
+                for eps_k in eps_j_k.T
+            ], axis=1))
+        if self.beta_l.ndim != 1 or self.beta_l.size < 1:
+            raise ValueError(
+                f"beta_l must be a non-empty ladder but this is {beta_l}"
+            )
+        param_j_i = np.array(param_init_j_i, dtype=np.float64)
+        if param_j_i.ndim != 2 or param_j_i.shape[1] != sampler.n_dim or param_j_i.shape[0] < 1:
+            raise ValueError(
+                f"param_init_j_i must be (I, {sampler.n_dim}) but this is {param_j_i.shape}"
+            )
+        self.rng = np.random.default_rng(random_state)
+        self.n_particle = param_j_i.shape[0]
+        self.n_dim = sampler.n_dim
+        # state of the particles at the current beta
+        self.level = 0
+        self.param_j_i = param_j_i
+        self.lcp_i = sampler.log_condprob_batch(param_j_i)
+        self.lpp_i = sampler.log_priorprob_batch(param_j_i)
+        self.log_w_i = np.zeros(self.n_particle)
+        # index of the initial particle each particle descends from
+        self.ancestor_i = np.arange(self.n_particle)
+        # statistics of each beta
+        n_level = self.beta_l.size
+        self.log_ratio_l = np.zeros(n_level)
+        self.ess_l = np.full(n_level, np.nan)
+        self.ess_l[0] = self.n_particle
+        self.resampled_l = np.zeros(n_level, dtype=bool)
+        self.accept_j_l = np.full((n_level, self.n_dim), np.nan)
+        self.n_family_l = np.zeros(n_level, dtype=np.int64)
+        self.n_family_l[0] = self.n_particle
+        self.lcp_mean_l = np.full(n_level, np.nan)
+        self.lcp_mean_l[0] = self.lcp_i.mean()
+
+    def run(self, verbose=True):
+        """
+        anneal the particles to the last beta
+
+        Parameters
+        ----------
+        verbose: bool, default=True
+            print the statistics of each beta
+        """
+        while self.level + 1 < self.beta_l.size:
+            self.step()
+            if verbose:
+                l = self.level
+                print(
+                    f"beta={self.beta_l[l]:.4g}: log_ratio={self.log_ratio_l[l]:.6g}, "
+                    f"ess={self.ess_l[l]:.1f}, families={self.n_family_l[l]}, "
+                    f"accept={np.nanmean(self.accept_j_l[l]):.3f}"
+                    + (", resampled" if self.resampled_l[l] else "")
+                )
+
+    def step(self):
+        """move the particles to the next beta: reweight, resample and sweep"""
+        if self.level + 1 >= self.beta_l.size:
+            raise ValueError(
+                f"particles are already at the last beta {self.beta_l[-1]}"
+            )
+        l = self.level + 1
+        # incremental weights, whose mean under the current weights is Z(beta_l)/Z(beta_l-1)
+        log_w_new_i = self.log_w_i + (self.beta_l[l] - self.beta_l[l - 1]) * self.lcp_i
+        self.log_ratio_l[l] = self.log_ratio_l[l - 1]\
+            + logsumexp(log_w_new_i) - logsumexp(self.log_w_i)
+        self.log_w_i = log_w_new_i - log_w_new_i.max()
+        self.ess_l[l] = self.ess
+        if self.ess_l[l] < self.resample_threshold * self.n_particle:
+            self.resample()
+            self.resampled_l[l] = True
+        self.level = l
+        accept_j = np.zeros(self.n_dim)
+        for _ in range(self.n_sweep):
+            accept_j += self.sweep(self.beta_l[l], self.eps_j_l[l])
+        if self.n_sweep > 0:
+            self.accept_j_l[l] = accept_j / self.n_sweep
+        self.n_family_l[l] = np.count_nonzero(np.bincount(self.ancestor_i, minlength=self.n_particle))
+        self.lcp_mean_l[l] = np.sum(self.weight_i * self.lcp_i)
+
+    def resample(self):
+        """systematic resampling of the particles by their weights"""
+        cum_w_i = np.cumsum(self.weight_i)
+        cum_w_i[-1] = 1.
+        u_i = (self.rng.random() + np.arange(self.n_particle)) / self.n_particle
+        index_i = np.searchsorted(cum_w_i, u_i)
+        self.param_j_i = self.param_j_i[index_i]
+        self.lcp_i = self.lcp_i[index_i]
+        self.lpp_i = self.lpp_i[index_i]
+        self.ancestor_i = self.ancestor_i[index_i]
+        self.log_w_i = np.zeros(self.n_particle)
+
+    def sweep(self, beta, eps_j):
+        """
+        Metropolis-Hastings update of each block for all particles
+
+        Parameters
+        ----------
+        beta: float
+            target temperature
+        eps_j: np.ndarray (J,)
+            step width
+
+        Returns
+        -------
+        np.ndarray (J,)
+            acceptance rate of each parameter
+        """
+        block_b = self.sampler.block_b
+        step_j_i = self.rng.standard_normal((self.n_particle, self.n_dim)) * eps_j
+        with np.errstate(divide="ignore"):
+            log_u_i_b = np.log(self.rng.random((len(block_b), self.n_particle)))
+        ll_i = beta * self.lcp_i + self.lpp_i
+        accept_j = np.zeros(self.n_dim)
+        for b, j_b in enumerate(block_b):
+            param_new_j_i = self.param_j_i.copy()
+            param_new_j_i[:, j_b] += step_j_i[:, j_b]
+            lcp_new_i = self.sampler.log_condprob_batch(param_new_j_i)
+            lpp_new_i = self.sampler.log_priorprob_batch(param_new_j_i)
+            ll_new_i = beta * lcp_new_i + lpp_new_i
+            with np.errstate(invalid="ignore"):
+                accept_i = (ll_new_i >= ll_i) | (log_u_i_b[b] < ll_new_i - ll_i)
+            # masked copies, which are faster than boolean indexing for many particles
+            np.copyto(self.param_j_i, param_new_j_i, where=accept_i[:, np.newaxis])
+            np.copyto(self.lcp_i, lcp_new_i, where=accept_i)
+            np.copyto(self.lpp_i, lpp_new_i, where=accept_i)
+            np.copyto(ll_i, ll_new_i, where=accept_i)
+            accept_j[j_b] = accept_i.mean()
+        return accept_j
+
+    @property
+    def beta(self):
+        """current beta"""
+        return self.beta_l[self.level]
+
+    @property
+    def weight_i(self):
+        """(I,) normalized weights of the particles"""
+        w_i = np.exp(self.log_w_i - self.log_w_i.max())
+        return w_i / w_i.sum()
+
+    @property
+    def ess(self):
+        """effective sample size of the weights"""
+        return np.exp(2 * logsumexp(self.log_w_i) - logsumexp(2 * self.log_w_i))
+
+    @property
+    def log_ratio(self):
+        """log Z(beta) - log Z(beta_0) at the current beta"""
+        return self.log_ratio_l[self.level]
+
+    def mean_j(self):
+        """(J,) weighted mean of the particles"""
+        return self.weight_i @ self.param_j_i
+
+    def cov_j_j(self):
+        """(J, J) weighted covariance of the particles"""
+        dev_j_i = self.param_j_i - self.mean_j()
+        return (dev_j_i * self.weight_i[:, np.newaxis]).T @ dev_j_i
@@ -0,0 +1,183 @@
+import numpy as np
+
+
+def gelman_rubin(sample_j_n_k_c):
+    """
+    potential scale reduction factor (R-hat) of Gelman and Rubin
+
+    Ratio of the pooled variance estimate to the mean within-chain variance,
+    which approaches 1 when all chains sample the same distribution.
+
+    Parameters
+    ----------
+    sample_j_n_k_c: np.ndarray (C, K, N, J)
+        samples of each chain
+
+    Returns
+    -------
+    np.ndarray (K, J)
+        R-hat of each temperature and parameter
+    """
+    sample_j_n_k_c = np.asarray(sample_j_n_k_c, dtype=np.float64)
+    n_chain, _n_temp, n_sample, _n_dim = sample_j_n_k_c.shape
+    if n_chain < 2 or n_sample < 2:
+        raise ValueError(
+            f"R-hat needs at least 2 chains of 2 samples but this is {n_chain} chains of {n_sample}"
+        )
+    # within-chain variance and variance of chain means (B / N)
+    within_j_k = sample_j_n_k_c.var(axis=2, ddof=1).mean(axis=0)
+    between_j_k = sample_j_n_k_c.mean(axis=2).var(axis=0, ddof=1)
+    var_j_k = (n_sample - 1) / n_sample * within_j_k + between_j_k
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.sqrt(var_j_k / within_j_k)
+
+
+def walker_slots(walker_n_k):
+    """
+    replica of each walker, from the walker at each replica (`walker_n_k` of the sampler)
+
+    Parameters
+    ----------
+    walker_n_k: np.ndarray (K, N)
+        walker at each replica in each row
+
+    Returns
+    -------
+    np.ndarray (K, N)
+        replica at which each walker is in each row (inverse permutation of each row)
+    """
+    walker_n_k = np.asarray(walker_n_k)
+    n_temp, n_rows = walker_n_k.shape
+    slot_n_w = np.empty((n_temp, n_rows), dtype=walker_n_k.dtype)
+    slot_n_w[walker_n_k, np.arange(n_rows)] = np.arange(n_temp)[:, np.newaxis]
+    return slot_n_w
+
+
+def round_trips(walker_n_k, n_beta):
+    """
+    rows at which each walker comes back to the first beta from the last
+
+    Counted on the given rows only, so that visits to an end may be missed
+    in a history recorded with `burnin` or `thin`.
+
+    Parameters
+    ----------
+    walker_n_k: np.ndarray (C*K, N)
+        walker at each replica in each row
+    n_beta: int
+        number of betas of a chain
+
+    Returns
+    -------
+    list[np.ndarray] (C*K,)
+        rows of the round trips of each walker; their differences are the round trip times
+    """
+    if n_beta < 2:
+        raise ValueError(
+            f"round trips need at least 2 betas but this is {n_beta}"
+        )
+    beta_index_n_w = walker_slots(walker_n_k) % n_beta
+    row_n_w = []
+    for beta_index_n in beta_index_n_w:
+        # rows at an end, and the rows where the walker reaches the other end
+        row_e = np.flatnonzero((beta_index_n == 0) | (beta_index_n == n_beta - 1))
+        first_e = beta_index_n[row_e] == 0
+        turn_e = np.concatenate([[False], first_e[1:] & ~first_e[:-1]])
+        row_n_w.append(row_e[turn_e])
+    return row_n_w
+
+
+class OnlineStats(object):
+    """
+    running counters of a sampler, updated at O(1) cost per step
+
+    Acceptance of the M-H steps of each replica and parameter, swap rates of
+    neighbouring pairs, and round trips of walkers (replica states followed through
+    the exchanges) from the first beta to the last and back, in each chain.
+    The counters run from the start of the sampler; the difference of two
+    snapshots gives the rates in between.
+    """
+    def __init__(self, n_chain, n_beta, n_dim):
+        """
+        Parameters
+        ----------
+        n_chain: int
+            number of chains
+        n_beta: int
+            number of betas of a chain
+        n_dim: int
+            number of parameters
+        """
+        n_temp = n_chain * n_beta
+        self.n_chain = n_chain
+        self.n_beta = n_beta
+        self.n_step = 0
+        self.accept_count_j_k = np.zeros((n_temp, n_dim), dtype=np.int64)
+        self.n_exchange = 0
+        self.swap_try_count_k = np.zeros(max(n_temp - 1, 0), dtype=np.int64)
+        self.swap_accept_count_k = np.zeros(max(n_temp - 1, 0), dtype=np.int64)
+        # last end of the ladder each walker visited, -1: none, 0: first beta, 1: last beta
+        self.end_w = np.full(n_temp, -1, dtype=np.int8)
+        self.round_trip_c = np.zeros(n_chain, dtype=np.int64)
+        self.count_ends(np.arange(n_temp))
+
+    def count_steps(self, accept_j_n_k):
+        """
+        add M-H steps
+
+        Parameters
+        ----------
+        accept_j_n_k: np.ndarray (K, N, J)
+            acceptances of the steps just done
+        """
+        self.n_step += accept_j_n_k.shape[1]
+        self.accept_count_j_k += (accept_j_n_k == 1).sum(axis=1)
+
+    def count_exchange(self, try_k, accept_k, walker_k):
+        """
+        add an exchange step
+
+        Parameters
+        ----------
+        try_k: list[int] (K-1,)
+            number of tries of the pair of k-th and (k+1)-th replicas
+        accept_k: list[int] (K-1,)
+            number of swaps of the pair
+        walker_k: np.ndarray (K,)
+            walker at each replica after the exchange
+        """
+        self.n_exchange += 1
+        self.swap_try_count_k += np.asarray(try_k, dtype=np.int64)
+        self.swap_accept_count_k += np.asarray(accept_k, dtype=np.int64)
+        self.count_ends(walker_k)
+
+    def count_ends(self, walker_k):
+        """count a round trip when a walker comes back to the first beta from the last"""
+        walker_l_c = np.asarray(walker_k).reshape(self.n_chain, self.n_beta)
+        first_c = walker_l_c[:, 0]
+        self.round_trip_c += self.end_w[first_c] == 1
+        self.end_w[first_c] = 0
+        if self.n_beta > 1:
+            self.end_w[walker_l_c[:, -1]] = 1
+
+    def snapshot(self):
+        """
+        current statistics
+
+        Returns
+        -------
+        dict
+            n_step: number of M-H steps
+            accept_rate_j_k: (K, J) acceptance rate of each replica and parameter
+            n_exchange: number of exchange steps
+            swap_rate_k: (K-1,) swap rate of each neighbouring pair, nan if never tried
+            round_trip_c: (C,) number of round trips in each chain
+        """
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return {
+                "n_step": self.n_step,
+                "accept_rate_j_k": self.accept_count_j_k / max(self.n_step, 1),
+                "n_exchange": self.n_exchange,
+                "swap_rate_k": self.swap_accept_count_k / self.swap_try_count_k,
+                "round_trip_c": self.round_trip_c.copy(),
+            }
@@ -0,0 +1,454 @@
+import numpy as np
+from numba import njit, prange
+
+# maximum number of random numbers of each kind drawn at once by `draw_steps`
+RANDOM_BLOCK_SIZE = 1 << 16
+
+
+@njit
+def random_rows(n_dim, n_test):
+    """number of M-H steps whose random numbers are drawn at once"""
+    return max(1, RANDOM_BLOCK_SIZE // max(n_dim, n_test, 1))
+
+
+@njit(nogil=True)
+def draw_steps(rng, eps_j, n_test, n_rows):
+    """
+    random numbers of `n_rows` M-H steps of a replica, drawn at once
+
+    Drawing in blocks avoids a call of the generator for each proposal and each test.
+    Shared by the python path and the compiled kernels,
+    so that both consume the same numbers in the same order.
+
+    Parameters
+    ----------
+    rng: np.random.Generator
+        random number generator of the replica
+    eps_j: f8[:] (J,)
+        step width
+    n_test: int
+        number of Metropolis tests in a step
+    n_rows: int
+        number of steps
+
+    Returns
+    -------
+    step_j_s: f8[:, :] (n_rows, J)
+        gaussian steps of the width `eps_j`
+    log_u_b_s: f8[:, :] (n_rows, n_test)
+        log of uniform variates, a suggestion is accepted if `log_u < ll_new - ll_pre`
+    """
+    step_j_s = rng.standard_normal((n_rows, eps_j.size)) * eps_j
+    log_u_b_s = np.log(rng.random((n_rows, n_test)))
+    return step_j_s, log_u_b_s
+
+
+@njit(nogil=True)
+def sweep_replica(
+    log_condprob, condprob_args, log_priorprob, priorprob_args,
+    k, beta_k, eps_j_k, block_ptr_b, block_index, walker_k, param_j_w, lcp_w, lpp_w, ll_w,
+    sample_j_n_k, lcp_sample_n_k, lpp_sample_n_k, ll_sample_n_k, accept_j_n_k,
+    n_start, batch, rng
+):
+    """
+    M-H steps of k-th replica, block by block, in one compiled call
+
+    Same computation as `ReplicaExchangeBase.update_parallel` with the python path:
+    `batch` steps are written to the rows from `n_start` of k-th history,
+    and the current state of the walker at k-th replica (`param_j_w`, `lcp_w`, `lpp_w`, `ll_w`
+    at `walker_k[k]`) is updated in place.
+    Compiled without the GIL, and each call writes only k-th rows,
+    so that replicas can be updated in parallel threads.
+
+    Parameters
+    ----------
+    log_condprob: njit function
+        log conditional probability, called as `log_condprob(param_j, *condprob_args)`
+    condprob_args: tuple
+        additional arguments of `log_condprob`
+    log_priorprob: njit function
+        log prior probability, called as `log_priorprob(param_j, *priorprob_args)`
+    priorprob_args: tuple
+        additional arguments of `log_priorprob`
+    k: int
+        index of the replica to update
+    beta_k: f8[:] (K,)
+    eps_j_k: f8[:, :] (K, J)
+    block_ptr_b, block_index: i8[:]
+        parameter indices of b-th block are `block_index[block_ptr_b[b]:block_ptr_b[b+1]]`
+    walker_k: i8[:] (K,)
+        walker at each replica
+    param_j_w: f8[:, :] (K, J)
+    lcp_w, lpp_w, ll_w: f8[:] (K,)
+        current state of each walker
+    sample_j_n_k, lcp_sample_n_k, lpp_sample_n_k, ll_sample_n_k, accept_j_n_k: arrays
+        history to write
+    n_start: int
+        first row to write
+    batch: int
+        number of continuus calculation
+    rng: np.random.Generator
+        random number generator of k-th replica, read in blocks by `draw_steps`
+    """
+    n_dim = param_j_w.shape[1]
+    n_block = block_ptr_b.size - 1
+    n_rows = random_rows(n_dim, n_block)
+    step_j_s = np.empty((0, n_dim))
+    log_u_b_s = np.empty((0, n_block))
+    beta = beta_k[k]
+    w = walker_k[k]
+    param_j_pre = param_j_w[w].copy()
+    lcp_pre = lcp_w[w]
+    lpp_pre = lpp_w[w]
+    ll_pre = ll_w[w]
+    for n in range(n_start, n_start + batch):
+        s = (n - n_start) % n_rows
+        if s == 0:
+            step_j_s, log_u_b_s = draw_steps(
+                rng, eps_j_k[k], n_block, min(n_rows, n_start + batch - n))
+        for b in range(n_block):
+            j_b = block_index[block_ptr_b[b]:block_ptr_b[b + 1]]
+            param_j_new = param_j_pre.copy()
+            for j in j_b:
+                param_j_new[j] += step_j_s[s, j]
+            lcp_new = log_condprob(param_j_new, *condprob_args)
+            lpp_new = log_priorprob(param_j_new, *priorprob_args)
+            ll_new = lcp_new * beta + lpp_new
+            if ll_new >= ll_pre or log_u_b_s[s, b] < ll_new - ll_pre:
+                param_j_pre = param_j_new
+                lcp_pre = lcp_new
+                lpp_pre = lpp_new
+                ll_pre = ll_new
+                accept_j_n_k[k, n, j_b] = 1
+            else:
+                accept_j_n_k[k, n, j_b] = 0
+        sample_j_n_k[k, n] = param_j_pre
+        lcp_sample_n_k[k, n] = lcp_pre
+        lpp_sample_n_k[k, n] = lpp_pre
+        ll_sample_n_k[k, n] = ll_pre
+    param_j_w[w] = param_j_pre
+    lcp_w[w] = lcp_pre
+    lpp_w[w] = lpp_pre
+    ll_w[w] = ll_pre
+
+
+
+@njit(nogil=True)
+def sweep_separable(
+    log_condprob_term, condprob_args, log_priorprob_term, priorprob_args,
+    k, beta_k, eps_j_k, block_ptr_b, block_index, walker_k, param_j_w, lcp_w, lpp_w, ll_w,
+    lcp_term_j_w, lpp_term_j_w,
+    sample_j_n_k, lcp_sample_n_k, lpp_sample_n_k, ll_sample_n_k, accept_j_n_k,
+    n_start, batch, rng
+):
+    """
+    `sweep_replica` for separable model
+
+    Only the terms of the suggested block are calculated,
+    and the log probabilities are updated by their differences,
+    so that a sweep costs O(J) instead of O(J^2).
+    The sums are recalculated from the terms once per sweep.
+
+    Parameters
+    ----------
+    log_condprob_term: njit function
+        j-th term of log conditional probability,
+        called as `log_condprob_term(param_j[j], j, *condprob_args)`
+    condprob_args: tuple
+        additional arguments of `log_condprob_term`
+    log_priorprob_term: njit function
+        j-th term of log prior probability,
+        called as `log_priorprob_term(param_j[j], j, *priorprob_args)`
+    priorprob_args: tuple
+        additional arguments of `log_priorprob_term`
+    lcp_term_j_w, lpp_term_j_w: f8[:, :] (K, J)
+        terms of the current state of each walker, updated in place
+
+    See `sweep_replica` for the other parameters.
+    """
+    n_dim = param_j_w.shape[1]
+    n_block = block_ptr_b.size - 1
+    n_rows = random_rows(n_dim, n_block)
+    step_j_s = np.empty((0, n_dim))
+    log_u_b_s = np.empty((0, n_block))
+    param_old_j = np.empty(n_dim)
+    lcp_term_new_j = np.empty(n_dim)
+    lpp_term_new_j = np.empty(n_dim)
+    beta = beta_k[k]
+    w = walker_k[k]
+    param_j = param_j_w[w].copy()
+    lcp_term_j = lcp_term_j_w[w]
+    lpp_term_j = lpp_term_j_w[w]
+    lcp_pre = lcp_w[w]
+    lpp_pre = lpp_w[w]
+    ll_pre = ll_w[w]
+    for n in range(n_start, n_start + batch):
+        s = (n - n_start) % n_rows
+        if s == 0:
+            step_j_s, log_u_b_s = draw_steps(
+                rng, eps_j_k[k], n_block, min(n_rows, n_start + batch - n))
+        for b in range(n_block):
+            j_b = block_index[block_ptr_b[b]:block_ptr_b[b + 1]]
+            # suggest in place, and restore if rejected
+            for j in j_b:
+                param_old_j[j] = param_j[j]
+                param_j[j] += step_j_s[s, j]
+            lcp_block_new = 0.0
+            lpp_block_new = 0.0
+            lcp_block_pre = 0.0
+            lpp_block_pre = 0.0
+            for j in j_b:
+                lcp_term_new_j[j] = log_condprob_term(param_j[j], j, *condprob_args)
+                lpp_term_new_j[j] = log_priorprob_term(param_j[j], j, *priorprob_args)
+                lcp_block_new += lcp_term_new_j[j]
+                lpp_block_new += lpp_term_new_j[j]
+                lcp_block_pre += lcp_term_j[j]
+                lpp_block_pre += lpp_term_j[j]
+            lcp_new = lcp_pre + lcp_block_new - lcp_block_pre
+            lpp_new = lpp_pre + lpp_block_new - lpp_block_pre
+            ll_new = lcp_new * beta + lpp_new
+            if ll_new >= ll_pre or log_u_b_s[s, b] < ll_new - ll_pre:
+                lcp_pre = lcp_new
+                lpp_pre = lpp_new
+                ll_pre = ll_new
+                for j in j_b:
+                    lcp_term_j[j] = lcp_term_new_j[j]
+                    lpp_term_j[j] = lpp_term_new_j[j]
+                accept_j_n_k[k, n, j_b] = 1
+            else:
+                for j in j_b:
+                    param_j[j] = param_old_j[j]
+                accept_j_n_k[k, n, j_b] = 0
+        lcp_pre = lcp_term_j.sum()
+        lpp_pre = lpp_term_j.sum()
+        ll_pre = lcp_pre * beta + lpp_pre
+        sample_j_n_k[k, n] = param_j
+        lcp_sample_n_k[k, n] = lcp_pre
+        lpp_sample_n_k[k, n] = lpp_pre
+        ll_sample_n_k[k, n] = ll_pre
+    param_j_w[w] = param_j
+    lcp_w[w] = lcp_pre
+    lpp_w[w] = lpp_pre
+    ll_w[w] = ll_pre
+
+
+@njit
+def _factor_union(j_b, factor_ptr_j, factor_index, mark_f, stamp, out_f):
+    """
+    collect factors depending on any parameter of `j_b` into `out_f`
+
+    Returns
+    -------
+    int
+        number of collected factors
+    """
+    n_out = 0
+    for j in j_b:
+        for p in range(factor_ptr_j[j], factor_ptr_j[j + 1]):
+            f = factor_index[p]
+            if mark_f[f] != stamp:
+                mark_f[f] = stamp
+                out_f[n_out] = f
+                n_out += 1
+    return n_out
+
+
+@njit(nogil=True)
+def sweep_factor(
+    log_condprob_factor, condprob_args, condprob_factor_ptr_j, condprob_factor_index,
+    log_priorprob_factor, priorprob_args, priorprob_factor_ptr_j, priorprob_factor_index,
+    k, beta_k, eps_j_k, block_ptr_b, block_index, walker_k, param_j_w, lcp_w, lpp_w, ll_w,
+    lcp_term_t_w, lpp_term_t_w,
+    sample_j_n_k, lcp_sample_n_k, lpp_sample_n_k, ll_sample_n_k, accept_j_n_k,
+    n_start, batch, rng
+):
+    """
+    `sweep_replica` for factorized model
+
+    Only the factors depending on the suggested block are calculated,
+    and the log probabilities are updated by their differences.
+    The sums are recalculated from the factors once per sweep.
+
+    Parameters
+    ----------
+    log_condprob_factor: njit function
+        f-th factor of log conditional probability,
+        called as `log_condprob_factor(f, param_j, *condprob_args)`
+    condprob_args: tuple
+        additional arguments of `log_condprob_factor`
+    condprob_factor_ptr_j, condprob_factor_index: i8[:]
+        factors depending on j-th parameter are
+        `condprob_factor_index[condprob_factor_ptr_j[j]:condprob_factor_ptr_j[j+1]]`
+    log_priorprob_factor, priorprob_args, priorprob_factor_ptr_j, priorprob_factor_index:
+        same for log prior probability
+    lcp_term_t_w, lpp_term_t_w: f8[:, :] (K, N_factor)
+        factors of the current state of each walker, updated in place
+
+    See `sweep_replica` for the other parameters.
+    """
+    n_dim = param_j_w.shape[1]
+    n_block = block_ptr_b.size - 1
+    n_rows = random_rows(n_dim, n_block)
+    step_j_s = np.empty((0, n_dim))
+    log_u_b_s = np.empty((0, n_block))
+    param_old_j = np.empty(n_dim)
+    lcp_term_new_t = np.empty(lcp_term_t_w.shape[1])
+    lpp_term_new_t = np.empty(lpp_term_t_w.shape[1])
+    lcp_mark_t = np.zeros(lcp_term_t_w.shape[1], dtype=np.int64)
+    lpp_mark_t = np.zeros(lpp_term_t_w.shape[1], dtype=np.int64)
+    lcp_t_b = np.empty(lcp_term_t_w.shape[1], dtype=np.int64)
+    lpp_t_b = np.empty(lpp_term_t_w.shape[1], dtype=np.int64)
+    stamp = 0
+    beta = beta_k[k]
+    w = walker_k[k]
+    param_j = param_j_w[w].copy()
+    lcp_term_t = lcp_term_t_w[w]
+    lpp_term_t = lpp_term_t_w[w]
+    lcp_pre = lcp_w[w]
+    lpp_pre = lpp_w[w]
+    ll_pre = ll_w[w]
+    for n in range(n_start, n_start + batch):
+        s = (n - n_start) % n_rows
+        if s == 0:
+            step_j_s, log_u_b_s = draw_steps(
+                rng, eps_j_k[k], n_block, min(n_rows, n_start + batch - n))
+        for b in range(n_block):
+            j_b = block_index[block_ptr_b[b]:block_ptr_b[b + 1]]
+            # suggest in place, and restore if rejected
+            for j in j_b:
+                param_old_j[j] = param_j[j]
+                param_j[j] += step_j_s[s, j]
+            stamp += 1
+            n_lcp = _factor_union(
+                j_b, condprob_factor_ptr_j, condprob_factor_index, lcp_mark_t, stamp, lcp_t_b)
+            n_lpp = _factor_union(
+                j_b, priorprob_factor_ptr_j, priorprob_factor_index, lpp_mark_t, stamp, lpp_t_b)
+            lcp_new = lcp_pre
+            for i in range(n_lcp):
+                t = lcp_t_b[i]
+                lcp_term_new_t[t] = log_condprob_factor(t, param_j, *condprob_args)
+                lcp_new += lcp_term_new_t[t] - lcp_term_t[t]
+            lpp_new = lpp_pre
+            for i in range(n_lpp):
+                t = lpp_t_b[i]
+                lpp_term_new_t[t] = log_priorprob_factor(t, param_j, *priorprob_args)
+                lpp_new += lpp_term_new_t[t] - lpp_term_t[t]
+            ll_new = lcp_new * beta + lpp_new
+            if ll_new >= ll_pre or log_u_b_s[s, b] < ll_new - ll_pre:
+                lcp_pre = lcp_new
+                lpp_pre = lpp_new
+                ll_pre = ll_new
+                for i in range(n_lcp):
+                    lcp_term_t[lcp_t_b[i]] = lcp_term_new_t[lcp_t_b[i]]
+                for i in range(n_lpp):
+                    lpp_term_t[lpp_t_b[i]] = lpp_term_new_t[lpp_t_b[i]]
+                accept_j_n_k[k, n, j_b] = 1
+            else:
+                for j in j_b:
+                    param_j[j] = param_old_j[j]
+                accept_j_n_k[k, n, j_b] = 0
+        lcp_pre = lcp_term_t.sum()
+        lpp_pre = lpp_term_t.sum()
+        ll_pre = lcp_pre * beta + lpp_pre
+        sample_j_n_k[k, n] = param_j
+        lcp_sample_n_k[k, n] = lcp_pre
+        lpp_sample_n_k[k, n] = lpp_pre
+        ll_sample_n_k[k, n] = ll_pre
+    param_j_w[w] = param_j
+    lcp_w[w] = lcp_pre
+    lpp_w[w] = lpp_pre
+    ll_w[w] = ll_pre
+
+
+@njit(parallel=True, nogil=True)
+def sweep_factor_colour(
+    log_condprob_factor, condprob_args, condprob_factor_ptr_j, condprob_factor_index,
+    log_priorprob_factor, priorprob_args, priorprob_factor_ptr_j, priorprob_factor_index,
+    k, beta_k, eps_j_k, colour_ptr_c, colour_index, walker_k, param_j_w, lcp_w, lpp_w, ll_w,
+    lcp_term_t_w, lpp_term_t_w,
+    sample_j_n_k, lcp_sample_n_k, lpp_sample_n_k, ll_sample_n_k, accept_j_n_k,
+    n_start, batch, rng
+):
+    """
+    `sweep_factor` updating parameters of the same colour concurrently
+
+    No factor depends on two parameters of the same colour,
+    so their single parameter M-H steps are independent and run in parallel threads
+    (checkerboard update). Random numbers are drawn in blocks before the steps,
+    the uniform variate of a parameter by its position in `colour_index`
+    as the python path with single parameter blocks in the order of colours,
+    so that the result does not depend on the number of threads.
+
+    Parameters
+    ----------
+    colour_ptr_c, colour_index: i8[:]
+        parameter indices of c-th colour are `colour_index[colour_ptr_c[c]:colour_ptr_c[c+1]]`
+
+    See `sweep_factor` for the other parameters.
+    """
+    n_dim = param_j_w.shape[1]
+    n_rows = random_rows(n_dim, n_dim)
+    step_j_s = np.empty((0, n_dim))
+    log_u_b_s = np.empty((0, n_dim))
+    accept_j = np.zeros(n_dim, dtype=np.int8)
+    lcp_diff_j = np.empty(n_dim)
+    lpp_diff_j = np.empty(n_dim)
+    lcp_term_new_t = np.empty(lcp_term_t_w.shape[1])
+    lpp_term_new_t = np.empty(lpp_term_t_w.shape[1])
+    beta = beta_k[k]
+    w = walker_k[k]
+    param_j = param_j_w[w].copy()
+    lcp_term_t = lcp_term_t_w[w]
+    lpp_term_t = lpp_term_t_w[w]
+    lcp_pre = lcp_w[w]
+    lpp_pre = lpp_w[w]
+    for n in range(n_start, n_start + batch):
+        s = (n - n_start) % n_rows
+        if s == 0:
+            step_j_s, log_u_b_s = draw_steps(
+                rng, eps_j_k[k], n_dim, min(n_rows, n_start + batch - n))
+        for c in range(colour_ptr_c.size - 1):
+            j_c = colour_index[colour_ptr_c[c]:colour_ptr_c[c + 1]]
+            for i in prange(j_c.size):
+                j = j_c[i]
+                param_old = param_j[j]
+                param_j[j] = param_old + step_j_s[s, j]
+                lcp_diff = 0.0
+                for p in range(condprob_factor_ptr_j[j], condprob_factor_ptr_j[j + 1]):
+                    t = condprob_factor_index[p]
+                    lcp_term_new_t[t] = log_condprob_factor(t, param_j, *condprob_args)
+                    lcp_diff += lcp_term_new_t[t] - lcp_term_t[t]
+                lpp_diff = 0.0
+                for p in range(priorprob_factor_ptr_j[j], priorprob_factor_ptr_j[j + 1]):
+                    t = priorprob_factor_index[p]
+                    lpp_term_new_t[t] = log_priorprob_factor(t, param_j, *priorprob_args)
+                    lpp_diff += lpp_term_new_t[t] - lpp_term_t[t]
+                ll_diff = lcp_diff * beta + lpp_diff
+                if ll_diff >= 0 or log_u_b_s[s, colour_ptr_c[c] + i] < ll_diff:
+                    accept_j[j] = 1
+                    lcp_diff_j[j] = lcp_diff
+                    lpp_diff_j[j] = lpp_diff
+                else:
+                    accept_j[j] = 0
+                    param_j[j] = param_old
+            for j in j_c:
+                accept_j_n_k[k, n, j] = accept_j[j]
+                if accept_j[j]:
+                    lcp_pre += lcp_diff_j[j]
+                    lpp_pre += lpp_diff_j[j]
+                    for p in range(condprob_factor_ptr_j[j], condprob_factor_ptr_j[j + 1]):
+                        t = condprob_factor_index[p]
+                        lcp_term_t[t] = lcp_term_new_t[t]
+                    for p in range(priorprob_factor_ptr_j[j], priorprob_factor_ptr_j[j + 1]):
+                        t = priorprob_factor_index[p]
+                        lpp_term_t[t] = lpp_term_new_t[t]
+        lcp_pre = lcp_term_t.sum()
+        lpp_pre = lpp_term_t.sum()
+        sample_j_n_k[k, n] = param_j
+        lcp_sample_n_k[k, n] = lcp_pre
+        lpp_sample_n_k[k, n] = lpp_pre
+        ll_sample_n_k[k, n] = lcp_pre * beta + lpp_pre
+    param_j_w[w] = param_j
+    lcp_w[w] = lcp_pre
+    lpp_w[w] = lpp_pre
+    ll_w[w] = lcp_pre * beta + lpp_pre
@@ -0,0 +1,306 @@
+import numpy as np
+
+from runfile import load_run
+
+
+def _logsumexp(a, axis):
+    """log of the sum of exp along `axis`, without overflow"""
+    a_max = np.max(a, axis=axis, keepdims=True)
+    a_max[~np.isfinite(a_max)] = 0
+    with np.errstate(divide="ignore"):
+        return np.log(np.sum(np.exp(a - a_max), axis=axis)) + np.squeeze(a_max, axis=axis)
+
+
+class EvidenceAccumulator(object):
+    """
+    streaming thermodynamic integration and stepping-stone estimates of the log evidence
+
+    Both estimate `log Z(beta_max) - log Z(beta_min)` of `Z(beta) = int exp(beta * lcp + lpp)`
+    from the log conditional probability (`lcp_sample_n_k`) sampled at each beta,
+    which is the log evidence when the smallest beta is 0 and `log_priorprob` is normalized.
+    Thermodynamic integration: trapezoidal rule of the mean of lcp over beta.
+    Stepping stone: sum of `log mean(exp((beta_next - beta) * lcp))` at each beta.
+
+    Rows are collected in blocks of `block_size`, and only the sums of each block are kept,
+    so that memory is (number of rows / block_size) and 10^7 rows can be added by chunks.
+    The blocks are also the units of the block bootstrap of the error,
+    which is valid when `block_size` is much longer than the autocorrelation time.
+    Each chain is estimated with its own ladder (which differ after `tune_ladder`),
+    and the estimate is the mean of those of the chains.
+    The error does not include the bias of the discrete ladder of thermodynamic integration.
+    """
+    def __init__(self, beta_k, n_chain=None, block_size=1000):
+        """
+        Parameters
+        ----------
+        beta_k: list[float] (K,) | list[list[float]] (C, K)
+            betas shared by the chains, or the betas of each chain,
+            in the order of the replicas
+        n_chain: int, optional
+            number of chains, whose replicas are stacked as k = c * K + (index of beta);
+            1 or the number of rows of a (C, K) `beta_k` by default
+        block_size: int, default=1000
+            number of rows in a block
+        """
+        if block_size < 1:
+            raise ValueError(
+                f"block_size must be positive but this is {block_size}"
+            )
+        beta_k_c = np.array(beta_k, dtype=np.float64)
+        if beta_k_c.ndim == 1:
+            beta_k_c = np.tile(beta_k_c, (1 if n_chain is None else n_chain, 1))
+        elif beta_k_c.ndim != 2 or n_chain not in (None, beta_k_c.shape[0]):
+            raise ValueError(
+                f"beta_k must be (K,) or ({n_chain}, K) but this is {beta_k_c.shape}"
+            )
+        if beta_k_c.shape[0] < 1 or beta_k_c.shape[1] < 2:
+            raise ValueError(
+                f"evidence needs at least 2 betas but this is {beta_k}"
+            )
+        self.beta_k_c = beta_k_c
+        self.n_chain, self.n_beta = beta_k_c.shape
+        # betas of each chain in ascending order
+        self.order_l_c = np.argsort(beta_k_c, axis=1, kind="stable")
+        self.beta_l_c = np.take_along_axis(beta_k_c, self.order_l_c, axis=1)
+        self.dbeta_l_c = np.diff(self.beta_l_c, axis=1)
+        self._block_n_k = np.empty((self.n_chain * self.n_beta, block_size))
+        self._n_block = 0
+        # number of rows, and sum of lcp and logsumexp of (beta_next - beta) * lcp
+        # at each beta of each chain in each block
+        self._count_b = []
+        self._sum_l_c_b = []
+        self._lse_l_c_b = []
+
+    def update(self, lcp_sample_n_k):
+        """
+        add rows
+
+        Parameters
+        ----------
+        lcp_sample_n_k: np.ndarray (C*K, N)
+            log conditional probability of each replica
+        """
+        block_size = self._block_n_k.shape[1]
+        n_rows = lcp_sample_n_k.shape[1]
+        n = 0
+        while n < n_rows:
+            m = min(n_rows - n, block_size - self._n_block)
+            self._block_n_k[:, self._n_block:self._n_block + m] = lcp_sample_n_k[:, n:n + m]
+            self._n_block += m
+            n += m
+            if self._n_block == block_size:
+                self.merge()
+
+    def merge(self):
+        """close the collected rows as a block"""
+        if self._n_block == 0:
+            return
+        lcp_n_l_c = np.take_along_axis(
+            self._block_n_k[:, :self._n_block].reshape(self.n_chain, self.n_beta, self._n_block),
+            self.order_l_c[:, :, np.newaxis], axis=1)
+        self._count_b.append(self._n_block)
+        self._sum_l_c_b.append(lcp_n_l_c.sum(axis=2))
+        with np.errstate(invalid="ignore"):
+            step_n_l_c = lcp_n_l_c[:, :-1] * self.dbeta_l_c[:, :, np.newaxis]
+        self._lse_l_c_b.append(_logsumexp(step_n_l_c, axis=2))
+        self._n_block = 0
+
+    @property
+    def n_sample(self):
+        """number of rows added"""
+        return sum(self._count_b) + self._n_block
+
+    def block_stats(self):
+        """
+        sums of each block
+
+        Returns
+        -------
+        count_b: np.ndarray (B,)
+            number of rows, i.e. samples at each beta of a chain
+        sum_l_c_b: np.ndarray (B, C, L)
+            sum of lcp at each beta of each chain, in ascending order of beta
+        lse_l_c_b: np.ndarray (B, C, L-1)
+            logsumexp of (beta_next - beta) * lcp at each beta but the largest
+        """
+        self.merge()
+        return (
+            np.array(self._count_b, dtype=np.float64),
+            np.array(self._sum_l_c_b, dtype=np.float64).reshape(-1, self.n_chain, self.n_beta),
+            np.array(self._lse_l_c_b, dtype=np.float64).reshape(-1, self.n_chain, self.n_beta - 1),
+        )
+
+    @property
+    def lcp_mean_l_c(self):
+        """(C, L) mean of lcp at each beta of each chain, in ascending order of beta"""
+        count_b, sum_l_c_b, _lse_l_c_b = self.block_stats()
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return sum_l_c_b.sum(axis=0) / count_b.sum()
+
+    def thermodynamic_integration_c(self):
+        """(C,) log evidence of each chain by thermodynamic integration"""
+        count_b, sum_l_c_b, _lse_l_c_b = self.block_stats()
+        return self._thermodynamic_integration(count_b.sum(), sum_l_c_b.sum(axis=0))
+
+    def stepping_stone_c(self):
+        """(C,) log evidence of each chain by stepping stone"""
+        count_b, _sum_l_c_b, lse_l_c_b = self.block_stats()
+        return self._stepping_stone(np.log(count_b.sum()), _logsumexp(lse_l_c_b, axis=0))
+
+    def thermodynamic_integration(self):
+        """log evidence by thermodynamic integration, mean of the chains"""
+        return self.thermodynamic_integration_c().mean()
+
+    def stepping_stone(self):
+        """log evidence by stepping stone, mean of the chains"""
+        return self.stepping_stone_c().mean()
+
+    def _thermodynamic_integration(self, count, sum_l_c):
+        """trapezoidal rule of the means of lcp, (..., C) from (...,) counts and (..., C, L) sums"""
+        mean_l_c = sum_l_c / np.asarray(count)[..., np.newaxis, np.newaxis]
+        return np.sum(self.dbeta_l_c * (mean_l_c[..., 1:] + mean_l_c[..., :-1]) / 2, axis=-1)
+
+    def _stepping_stone(self, log_count, lse_l_c):
+        """sum of the log ratios, (..., C) from (...,) log counts and (..., C, L-1) logsumexp"""
+        return np.sum(lse_l_c, axis=-1)\
+            - (self.n_beta - 1) * np.asarray(log_count)[..., np.newaxis]
+
+    def bootstrap(self, n_boot=1000, random_state=None, batch=100):
+        """
+        block bootstrap replicates of the estimates
+
+        Blocks are drawn with replacement, the same blocks for all betas and chains,
+        so that the correlation between betas (by the exchanges) is kept.
+
+        Parameters
+        ----------
+        n_boot: int, default=1000
+            number of replicates
+        random_state: int|np.random.Generator, optional
+            seed of the random number generator
+        batch: int, default=100
+            number of replicates calculated at once, to bound memory by (batch, B)
+
+        Returns
+        -------
+        ti_s: np.ndarray (n_boot,)
+            thermodynamic integration (mean of the chains) of each replicate
+        ss_s: np.ndarray (n_boot,)
+            stepping stone (mean of the chains) of each replicate
+        """
+        count_b, sum_l_c_b, lse_l_c_b = self.block_stats()
+        n_block = count_b.size
+        if n_block < 2:
+            raise ValueError(
+                f"bootstrap needs at least 2 blocks but this is {n_block}"
+            )
+        rng = np.random.default_rng(random_state)
+        # sums of exp relative to the largest block, not to overflow
+        lse_max_l_c = np.max(lse_l_c_b, axis=0)
+        lse_max_l_c[~np.isfinite(lse_max_l_c)] = 0
+        exp_l_c_b = np.exp(lse_l_c_b - lse_max_l_c)
+        ti_s = np.empty(n_boot)
+        ss_s = np.empty(n_boot)
+        for s in range(0, n_boot, batch):
+            m = min(batch, n_boot - s)
+            # number of times each block is drawn
+            weight_b_s = rng.multinomial(n_block, np.full(n_block, 1 / n_block), size=m)\
+                .astype(np.float64)
+            count_s = weight_b_s @ count_b
+            ti_s[s:s + m] = self._thermodynamic_integration(
+                count_s, np.tensordot(weight_b_s, sum_l_c_b, axes=1)).mean(axis=-1)
+            with np.errstate(divide="ignore"):
+                ss_s[s:s + m] = self._stepping_stone(
+                    np.log(count_s), np.log(np.tensordot(weight_b_s, exp_l_c_b, axes=1)) + lse_max_l_c
+                ).mean(axis=-1)
+        return ti_s, ss_s
+
+    def estimate(self, n_boot=1000, random_state=None):
+        """
+        log evidence with block bootstrap errors
+
+        Parameters
+        ----------
+        n_boot: int, default=1000
+            number of bootstrap replicates
+        random_state: int|np.random.Generator, optional
+            seed of the bootstrap
+
+        Returns
+        -------
+        dict
+            ti, ss: log evidence by thermodynamic integration and stepping stone,
+            mean of the chains
+            ti_err, ss_err: standard deviation of the bootstrap replicates
+            ti_c, ss_c: (C,) log evidence of each chain
+            n_sample: number of rows
+            n_block: number of blocks
+        """
+        ti_s, ss_s = self.bootstrap(n_boot, random_state)
+        return {
+            "ti": self.thermodynamic_integration(),
+            "ti_err": ti_s.std(ddof=1),
+            "ss": self.stepping_stone(),
+            "ss_err": ss_s.std(ddof=1),
+            "ti_c": self.thermodynamic_integration_c(),
+            "ss_c": self.stepping_stone_c(),
+            "n_sample": self.n_sample,
+            "n_block": len(self._count_b),
+        }
+
+
+def evidence_from_history(
+    lcp_sample_n_k, beta_k, n_chain=None, burnin=0, block_size=1000, chunk_size=65536
+):
+    """
+    accumulate a stored history of lcp, reading `chunk_size` rows at a time
+
+    A memmap history (`runfile.load_run`, `sink.read_chunks`) is not loaded at once.
+
+    Parameters
+    ----------
+    lcp_sample_n_k: np.ndarray (C*K, N)
+        log conditional probability of each replica
+    beta_k: list[float] (K,) | list[list[float]] (C, K)
+        betas shared by the chains, or the betas of each chain
+    n_chain: int, optional
+        number of chains, see `EvidenceAccumulator`
+    burnin: int, default=0
+        rows before `burnin`-th are skipped
+    block_size: int, default=1000
+        number of rows in a block of `EvidenceAccumulator`
+    chunk_size: int, default=65536
+        number of rows read at once
+
+    Returns
+    -------
+    EvidenceAccumulator
+    """
+    accumulator = EvidenceAccumulator(beta_k, n_chain, block_size)
+    n_rows = lcp_sample_n_k.shape[1]
+    for n in range(burnin, n_rows, chunk_size):
+        accumulator.update(np.asarray(lcp_sample_n_k[:, n:n + chunk_size], dtype=np.float64))
+    return accumulator
+
+
+def evidence_from_run(path, burnin=0, block_size=1000, chunk_size=65536):
+    """
+    `evidence_from_history` of a run saved by `save` or written by `ChunkSink`,
+    with the (saved, e.g. tuned) ladder of each chain
+
+    Parameters
+    ----------
+    path: str
+        run file, legacy pickle file or `ChunkSink` directory
+    burnin, block_size, chunk_size:
+        see `evidence_from_history`
+
+    Returns
+    -------
+    EvidenceAccumulator
+    """
+    run = load_run(path)
+    n_chain = run.get("n_chain", 1)
+    beta_k_c = np.asarray(run["beta_k"], dtype=np.float64).reshape(n_chain, -1)
+    return evidence_from_history(
+        run["lcp_sample_n_k"], beta_k_c, n_chain, burnin, block_size, chunk_size)
@@ -0,0 +1,120 @@
+import numpy as np
+
+
+class FactorGraph(object):
+    """
+    log probability as a sum of factors, each depending on a few parameters
+
+    The f-th factor is calculated by `log_factor(f, param_j, *args)`
+    and must depend only on `param_j[scope_f[f]]`.
+    """
+    def __init__(self, n_dim, scope_f, log_factor, args=()):
+        """
+        Parameters
+        ----------
+        n_dim: int
+            number of parameters
+        scope_f: list[list[int]] (N_factor, *)
+            indices of the parameters each factor depends on
+        log_factor: function (njit for compiled engines)
+            called as `log_factor(f, param_j, *args)`, returns f-th factor
+        args: tuple, default=()
+            additional arguments of `log_factor`
+        """
+        self.n_dim = n_dim
+        self.n_factor = len(scope_f)
+        self.scope_f = [np.unique(np.asarray(scope, dtype=np.int64)) for scope in scope_f]
+        if any(((scope < 0) | (scope >= n_dim)).any() for scope in self.scope_f):
+            raise ValueError(
+                f"scope of factors must be in [0, {n_dim}): {scope_f}"
+            )
+        self.log_factor = log_factor
+        self.args = args
+        # factors of each parameter, in CSR form
+        factor_j = [[] for _ in range(n_dim)]
+        for f, scope in enumerate(self.scope_f):
+            for j in scope:
+                factor_j[j].append(f)
+        self.factor_j = [np.array(factors, dtype=np.int64) for factors in factor_j]
+        self.factor_ptr_j = np.cumsum([0] + [len(factors) for factors in factor_j])
+        self.factor_index = np.array(
+            [f for factors in factor_j for f in factors], dtype=np.int64)
+
+    def evaluate(self, param_j) -> np.ndarray:
+        """
+        calc all factors
+
+        Parameters
+        ----------
+        param_j: np.ndarray (N_dim,)
+            param sample
+
+        Returns
+        -------
+        np.ndarray (N_factor,)
+            value of each factor
+        """
+        param_j = np.asarray(param_j, dtype=np.float64)
+        return np.array([
+            self.log_factor(f, param_j, *self.args)
+            for f in range(self.n_factor)
+        ], dtype=np.float64)
+
+    def factors_of(self, j_b) -> np.ndarray:
+        """
+        factors depending on any of the given parameters
+
+        Parameters
+        ----------
+        j_b: list[int]
+            indices of parameters
+
+        Returns
+        -------
+        np.ndarray[int]
+            indices of factors
+        """
+        if len(j_b) == 1:
+            return self.factor_j[j_b[0]]
+        return np.unique(np.concatenate([self.factor_j[j] for j in j_b]))
+
+
+def colour(n_dim, graphs):
+    """
+    colour the parameters so that no factor depends on two parameters of the same colour
+
+    Parameters of the same colour are conditionally independent,
+    and can be updated concurrently (like a checkerboard).
+    Greedy colouring in order of decreasing degree.
+
+    Parameters
+    ----------
+    n_dim: int
+        number of parameters
+    graphs: list[FactorGraph]
+        factor graphs of the log probabilities
+
+    Returns
+    -------
+    list[np.ndarray[int]]
+        parameter indices of each colour
+    """
+    neighbour_j = [set() for _ in range(n_dim)]
+    for graph in graphs:
+        for scope in graph.scope_f:
+            for j in scope:
+                neighbour_j[j].update(scope.tolist())
+    for j in range(n_dim):
+        neighbour_j[j].discard(j)
+    colour_j = [-1] * n_dim
+    for j in sorted(range(n_dim), key=lambda j: -len(neighbour_j[j])):
+        used = {colour_j[i] for i in neighbour_j[j]}
+        c = 0
+        while c in used:
+            c += 1
+        colour_j[j] = c
+    colour_j = np.array(colour_j, dtype=np.int64)
+    return [
+        np.flatnonzero(colour_j == c)
+        for c in range(colour_j.max() + 1 if n_dim else 0)
+    ]
@@ -1,11 +1,30 @@
 import pickle
 import os
 import datetime
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor
 from abc import abstractmethod
 import numpy as np
 from numba import njit, f8, i8
 
 from utils import target_function
+from storage import SampleStorage
+from engine import sweep_replica, sweep_separable, sweep_factor, sweep_factor_colour,\
+    draw_steps, random_rows
+from factor import colour
+from parallel import ReplicaProcessPool
+from diagnostics import gelman_rubin, OnlineStats
+from moments import RunningMoments
+from evidence import EvidenceAccumulator
+from runfile import write_run
+
+# maximum number of steps between the updates of `eps_j_k` in the warm-up of `sampling`
+TUNE_INTERVAL = 100
+# number of exchanges in the first round of `adapt_ladder`, doubled in each round
+LADDER_ROUND = 8
+# number of cycles run by `update_async` at once, between the checks of `sampling`
+# (sink, checkpoint, verbose output)
+ASYNC_ROUNDS = 64
 
 def shape(obj):
     r = ()
@@ -20,6 +39,10 @@ class ReplicaExchangeBase(object):
     """
     sampler by replica exchange
     """
+    # whether log_condprob / log_priorprob are sums of per-parameter terms,
+    # given by log_condprob_term / log_priorprob_term
+    separable = False
+
     def __init__(
         self,
         param_name_j,
@@ -29,33 +52,121 @@ class ReplicaExchangeBase(object):
         param_init_j_k=None,
         data=None,
         static_params=None,
-        random_state=None
+        random_state=None,
+        engine="python",
+        batch_log_condprob=None,
+        update_scheme="coordinate",
+        condprob_factors=None,
+        priorprob_factors=None,
+        n_threads=None,
+        n_workers=None,
+        n_chain=1,
+        record_k=None,
+        exchange_scheme="deo",
+        swap_sweeps=1,
+        swap_rule="metropolis"
     ):
         """init"""
+        # independent chains, whose replicas are stacked along the temperature axis:
+        # k = c * n_beta + (index of beta), and n_temp counts the replicas of all chains
+        if int(n_chain) != n_chain or n_chain < 1:
+            raise ValueError(
+                f"n_chain must be a positive integer but this is {n_chain}"
+            )
+        self.n_chain = int(n_chain)
+        self.n_beta = len(beta_k)
+        if self.n_chain > 1:
+            beta_k = np.tile(beta_k, self.n_chain)
+            eps_j_k = [eps_j for _c in range(self.n_chain) for eps_j in eps_j_k]
+            if shape(param_init_j_k)==(self.n_chain, self.n_beta, len(param_name_j)):
+                param_init_j_k = [
+                    param_j for param_j_k in param_init_j_k for param_j in param_j_k]
+            elif shape(param_init_j_k)==(self.n_beta, len(param_name_j)):
+                param_init_j_k = [
+                    param_j for _c in range(self.n_chain) for param_j in param_init_j_k]
         # initialize member variables
         self.param_name_j = param_name_j
         self.beta_k = beta_k
         self.eps_j_k = eps_j_k
-        self.beta2eps = {beta: eps_j for beta, eps_j in zip(beta_k, eps_j_k)}
+        # number of updates of `eps_j_k` by `adapt_eps`, and the step of the last one
+        self.n_adapt = 0
+        self.n_tune = 0
         self.exchange_step = exchange_step
         self.data = data
         self.static_params = static_params
         self.random_init = random_state
-        if random_state is not None:
-            np.random.seed(random_state)
+        if engine not in ("python", "numba", "vectorized"):
+            raise ValueError(
+                f"engine must be 'python', 'numba' or 'vectorized' but this is {engine}"
+            )
+        self.engine = engine
+        # pairs and test of the swaps in the exchange step, see `swap_sweep`
+        if exchange_scheme not in ("deo", "seo", "random"):
+            raise ValueError(
+                f"exchange_scheme must be 'deo', 'seo' or 'random' but this is {exchange_scheme}"
+            )
+        self.exchange_scheme = exchange_scheme
+        if int(swap_sweeps) != swap_sweeps or swap_sweeps < 1:
+            raise ValueError(
+                f"swap_sweeps must be a positive integer but this is {swap_sweeps}"
+            )
+        self.swap_sweeps = int(swap_sweeps)
+        if swap_rule not in ("metropolis", "gibbs"):
+            raise ValueError(
+                f"swap_rule must be 'metropolis' or 'gibbs' but this is {swap_rule}"
+            )
+        self.swap_rule = swap_rule
+        self.batch_log_condprob = batch_log_condprob
+        if n_threads is not None and engine != "numba":
+            raise ValueError(
+                f"n_threads needs engine 'numba' but engine is {engine}"
+            )
+        self.n_threads = n_threads
+        self.executor = None
+        if n_workers is not None and engine != "python":
+            raise ValueError(
+                f"n_workers needs engine 'python' but engine is {engine}"
+            )
+        self.n_workers = n_workers
+        self.process_pool = None
         self.n_dim = len(self.param_name_j)
         self.n_temp = len(self.beta_k)
+        if (condprob_factors is None) != (priorprob_factors is None):
+            raise ValueError(
+                "condprob_factors and priorprob_factors must be given together"
+            )
+        self.condprob_factors = condprob_factors
+        self.priorprob_factors = priorprob_factors
+        self.factorized = condprob_factors is not None
+        if self.factorized and self.separable:
+            raise ValueError(
+                "factorized model cannot be separable at the same time"
+            )
+        self.colour_c = colour(
+            self.n_dim, [condprob_factors, priorprob_factors]
+        ) if self.factorized and isinstance(update_scheme, str) and update_scheme == "colour" else None
+        if n_threads is not None and self.colour_c is not None:
+            raise ValueError(
+                "n_threads is not available for update_scheme 'colour'"
+            )
+        # random number generators: `rng_c` of each chain (exchange) and `rng_k`
+        # of each replica (M-H steps), spawned from a SeedSequence so that the streams
+        # are independent, and each replica draws from its own stream whichever engine
+        # updates it, so that a chain does not depend on the other chains
+        seed_sequence = np.random.SeedSequence(random_state)
+        seed_c = seed_sequence.spawn(self.n_chain)
+        self.rng_c = [np.random.default_rng(seed) for seed in seed_c]
+        self.rng_k = [
+            np.random.default_rng(seed)
+            for seed_chain in seed_c for seed in seed_chain.spawn(self.n_beta)
+        ]
+        self.block_b = self.parse_update_scheme(update_scheme)
+        self.update_scheme = update_scheme
         if shape(param_init_j_k)!=(self.n_temp, self.n_dim):
             raise ValueError(
-                f"param_init_j_k must be in shape (K, J) but this is {shape(param_init_j_k)}"
+                f"param_init_j_k must be in shape (K, J) or (C, K, J) but this is {shape(param_init_j_k)}"
             )
 
-        # get first sample
-        if param_init_j_k is None:
-            param_init_j_k = self.suggestion(
-                [np.random.rand() for pn in self.param_name_j],
-                self.eps_j_k[-1], 0)
-
         # initialize model
         # calc log likelihood at initial value
         log_cond_k = [
@@ -87,44 +198,276 @@ class ReplicaExchangeBase(object):
                 f"{log_pri_k}"
                 ", at init: "f"{param_init_j_k}"
             )
+        if self.n_temp > np.iinfo(np.int16).max + 1:
+            raise ValueError(
+                f"number of replicas must be at most {np.iinfo(np.int16).max + 1} but this is {self.n_temp}"
+            )
         # store initial values
-        self.sample_j_n_k = [
-            [param_init_j_k[k]]
-            for k in range(self.n_temp)
-        ]
-        assert shape(self.sample_j_n_k)==(self.n_temp, 1, self.n_dim), "sample_j_n_k"
-        self.lcp_sample_n_k = [
-            [log_cond_k[k]]
-            for k in range(self.n_temp)
-        ]
-        self.lpp_sample_n_k = [
-            [log_pri_k[k]]
-            for k in range(self.n_temp)
-        ]
-        self.ll_sample_n_k = [
-            [log_cond_k[k] * beta + log_pri_k[k]]
-            for k,beta in enumerate(self.beta_k)
-        ]
-        assert shape(self.lcp_sample_n_k)==(self.n_temp, 1), "cond_prob_sample_n_k"
-        assert shape(self.lpp_sample_n_k)==(self.n_temp, 1), "pri_prob_sample_n_k"
-        assert shape(self.ll_sample_n_k)==(self.n_temp, 1), "ll_sample_n_k"
-        self.accept_j_n_k = [
-            [[-1]*self.n_dim]
-            for k,_ in enumerate(self.beta_k)
-        ]
-        assert shape(self.accept_j_n_k)==(self.n_temp, 1, self.n_dim)
-        self.exchange_accept_n_k = [
-            [-1] for k in range(self.n_temp - 1)
-        ]
-        assert shape(self.exchange_accept_n_k) in {(self.n_temp - 1, 1), (0,)}
+        # the state belongs to a walker, which moves between the replicas by the exchange:
+        # `walker_k` is the walker at each replica, and the state of w-th walker is
+        # `param_j_w[w]` etc. (in slot order by `param_j_k` etc.)
+        self.walker_k = np.arange(self.n_temp)
+        self.param_j_w = np.array(param_init_j_k, dtype=np.float64)
+        self.lcp_w = np.array(log_cond_k, dtype=np.float64)
+        self.lpp_w = np.array(log_pri_k, dtype=np.float64)
+        self.ll_w = self.lcp_w * np.asarray(self.beta_k) + self.lpp_w
+        # terms of log probabilities of each walker, for separable (per parameter)
+        # and factorized (per factor) model
+        if self.separable:
+            self.lcp_term_t_w = np.array([
+                [self.log_condprob_term(param_j, j) for j in range(self.n_dim)]
+                for param_j in self.param_j_w
+            ])
+            self.lpp_term_t_w = np.array([
+                [self.log_priorprob_term(param_j, j) for j in range(self.n_dim)]
+                for param_j in self.param_j_w
+            ])
+        if self.factorized:
+            self.lcp_term_t_w = np.array([
+                self.condprob_factors.evaluate(param_j) for param_j in self.param_j_w
+            ]).reshape(self.n_temp, self.condprob_factors.n_factor)
+            self.lpp_term_t_w = np.array([
+                self.priorprob_factors.evaluate(param_j) for param_j in self.param_j_w
+            ]).reshape(self.n_temp, self.priorprob_factors.n_factor)
+        # temperatures whose params (and M-H acceptances) are recorded, in every chain;
+        # log probabilities and exchange acceptances are recorded for all
+        self.record_k = np.arange(self.n_beta) if record_k is None\
+            else np.unique(np.asarray(record_k, dtype=np.int64))
+        if self.record_k.size == 0 or self.record_k[0] < 0 or self.record_k[-1] >= self.n_beta:
+            raise ValueError(
+                f"record_k must be indices of beta_k in [0, {self.n_beta}): {record_k}"
+            )
+        self.record_index = (
+            np.arange(self.n_chain)[:, np.newaxis] * self.n_beta + self.record_k
+        ).ravel()
+        self.storage = SampleStorage(self.n_temp, self.n_dim, n_record=self.record_index.size)
+        # engines write to `buffer`, which is the storage itself when every row is recorded
+        self.buffer = self.storage
+        n = self.storage.extend(1)
+        self.storage.sample_j_n_k[:, n] = self.param_j_w[self.record_index]
+        self.storage.lcp_sample_n_k[:, n] = self.lcp_w
+        self.storage.lpp_sample_n_k[:, n] = self.lpp_w
+        self.storage.ll_sample_n_k[:, n] = self.ll_w
+        self.storage.accept_j_n_k[:, n] = -1
+        self.storage.exchange_accept_n_k[:, n] = -1
+        self.storage.walker_n_k[:, n] = self.walker_k
+        assert self.sample_j_n_k.shape==(self.record_index.size, 1, self.n_dim), "sample_j_n_k"
 
         self.loop_count = 1
         self.exchange_count = 0
+        self.stats = OnlineStats(self.n_chain, self.n_beta, self.n_dim)
+        # streaming moments of the samples, created by `sampling` with moments=True
+        self.moments = None
+        # streaming evidence estimates, created by `sampling` with evidence=True
+        self.evidence = None
+        # swap probabilities of neighbouring pairs summed in the current round of
+        # `adapt_ladder`, and their mean in the last round
+        self.swap_prob_sum_l_c = np.zeros((self.n_chain, self.n_beta - 1))
+        self.swap_prob_l_c = None
+        self.n_swap = 0
+        self.n_ladder = 0
+
+    def parse_update_scheme(self, update_scheme):
+        """
+        parameter blocks to be updated at once
+
+        Parameters
+        ----------
+        update_scheme: str | list[list[(int|str)]]
+            "coordinate": one parameter at a time (component-wise sweep)
+            "joint": all parameters at once
+            "colour": one parameter at a time in order of colours of factor graph,
+            parameters of the same colour are updated concurrently by the numba engine
+            list of blocks: indices or names of the parameters in each block,
+            every parameter must be in exactly one block
+
+        Returns
+        -------
+        list[np.ndarray[int]]
+            parameter indices of each block, in update order
+        """
+        if isinstance(update_scheme, str):
+            if update_scheme == "coordinate":
+                return [np.array([j]) for j in range(self.n_dim)]
+            if update_scheme == "joint":
+                return [np.arange(self.n_dim)]
+            if update_scheme == "colour":
+                if not self.factorized:
+                    raise ValueError(
+                        "update_scheme 'colour' needs factorized model"
+                    )
+                return [np.array([j]) for j_c in self.colour_c for j in j_c]
+            raise ValueError(
+                f"update_scheme must be 'coordinate', 'joint', 'colour' or list of blocks but this is {update_scheme}"
+            )
+        block_b = [
+            np.array([
+                self.param_name_j.index(j) if isinstance(j, str) else j
+                for j in j_b
+            ], dtype=np.int64)
+            for j_b in update_scheme
+        ]
+        if any(j_b.size == 0 for j_b in block_b)\
+                or sorted(np.concatenate(block_b).tolist()) != list(range(self.n_dim)):
+            raise ValueError(
+                f"every parameter must be in exactly one block: {update_scheme}"
+            )
+        return block_b
+
+    @property
+    def cached_terms(self):
+        """whether the terms of log probabilities are cached for each replica"""
+        return self.separable or self.factorized
+
+    # current state in the order of replicas
+    @property
+    def param_j_k(self):
+        """params of the walker at each replica, (K, J) array (copy)"""
+        return self.param_j_w[self.walker_k]
+
+    @property
+    def lcp_k(self):
+        """log conditional probability of the walker at each replica, (K,) array (copy)"""
+        return self.lcp_w[self.walker_k]
+
+    @property
+    def lpp_k(self):
+        """log prior probability of the walker at each replica, (K,) array (copy)"""
+        return self.lpp_w[self.walker_k]
+
+    @property
+    def ll_k(self):
+        """tempered log posterior probability of the walker at each replica, (K,) array (copy)"""
+        return self.ll_w[self.walker_k]
+
+    # sample history
+    @property
+    def sample_j_n_k(self):
+        """sampled params of `record_k`, (K, N, J) array view"""
+        return self.storage.sample_j_n_k
+
+    @property
+    def lcp_sample_n_k(self):
+        """log conditional probabilities, (K, N) array view"""
+        return self.storage.lcp_sample_n_k
+
+    @property
+    def lpp_sample_n_k(self):
+        """log prior probabilities, (K, N) array view"""
+        return self.storage.lpp_sample_n_k
+
+    @property
+    def ll_sample_n_k(self):
+        """tempered log posterior probabilities, (K, N) array view"""
+        return self.storage.ll_sample_n_k
+
+    @property
+    def accept_j_n_k(self):
+        """acceptance of each M-H step of `record_k`, (K, N, J) array view"""
+        return self.storage.accept_j_n_k
+
+    @property
+    def exchange_accept_n_k(self):
+        """acceptance of each exchange, (K-1, N) array view"""
+        return self.storage.exchange_accept_n_k
+
+    @property
+    def walker_n_k(self):
+        """walker at each replica, (K, N) int16 array view, see `diagnostics.walker_slots`"""
+        return self.storage.walker_n_k
+
+    # sample history of each chain
+    @property
+    def sample_j_n_k_c(self):
+        """sampled params, (C, K, N, J) array view"""
+        return self.split_chain(self.sample_j_n_k)
+
+    @property
+    def lcp_sample_n_k_c(self):
+        """log conditional probabilities, (C, K, N) array view"""
+        return self.split_chain(self.lcp_sample_n_k)
+
+    @property
+    def lpp_sample_n_k_c(self):
+        """log prior probabilities, (C, K, N) array view"""
+        return self.split_chain(self.lpp_sample_n_k)
+
+    @property
+    def ll_sample_n_k_c(self):
+        """tempered log posterior probabilities, (C, K, N) array view"""
+        return self.split_chain(self.ll_sample_n_k)
+
+    @property
+    def accept_j_n_k_c(self):
+        """acceptance of each M-H step, (C, K, N, J) array view"""
+        return self.split_chain(self.accept_j_n_k)
+
+    @property
+    def walker_n_k_c(self):
+        """walker at each replica, (C, K, N) int16 array view, with the labels of all chains"""
+        return self.split_chain(self.walker_n_k)
+
+    @property
+    def exchange_accept_n_k_c(self):
+        """acceptance of each exchange, (C, K-1, N) array view"""
+        # pairs across chains (every n_beta-th row) are skipped by the strides
+        exchange_accept_n_k = self.exchange_accept_n_k
+        return np.lib.stride_tricks.as_strided(
+            exchange_accept_n_k,
+            shape=(self.n_chain, max(self.n_beta - 1, 0), exchange_accept_n_k.shape[1]),
+            strides=(exchange_accept_n_k.strides[0] * self.n_beta, *exchange_accept_n_k.strides)
+        )
+
+    def split_chain(self, array_k):
+        """
+        view of the replicas of each chain
+
+        Parameters
+        ----------
+        array_k: np.ndarray (C*K, ...)
+            array of all (or recorded) replicas
+
+        Returns
+        -------
+        np.ndarray (C, K, ...)
+            zero-copy view
+        """
+        return array_k.reshape(self.n_chain, -1, *array_k.shape[1:])
+
+    def rhat(self, burnin=0):
+        """
+        potential scale reduction factor across chains, see `diagnostics.gelman_rubin`
+
+        The chains must be on the same ladder, e.g. not tuned by `tune_ladder=True`
+        (but "shared"), so that the replicas compared are at the same temperature.
+
+        Parameters
+        ----------
+        burnin: int, default=0
+            number of first samples to discard
+
+        Returns
+        -------
+        np.ndarray (K, J)
+            R-hat of each temperature and parameter
+        """
+        beta_l_c = np.asarray(self.beta_k, dtype=np.float64)\
+            .reshape(self.n_chain, self.n_beta)[:, self.record_k]
+        if not (beta_l_c == beta_l_c[0]).all():
+            raise ValueError(
+                "R-hat compares the chains at the same temperature, "
+                f"but the recorded betas of the chains differ: {beta_l_c}"
+            )
+        return gelman_rubin(self.sample_j_n_k_c[:, :, burnin:])
 
     # base algorithm
     def sampling(
         self, loopcount=1000,
-        verbose=True, verbose_count=10
+        verbose=True, verbose_count=10,
+        sink=None, burnin=0, thin=1,
+        checkpoint=None, checkpoint_interval=None,
+        tune=0, target_accept=None, tune_ladder=False,
+        moments=False, evidence=False, history=True, asynchronous=False
     ):
         """
         execute simulation
@@ -137,18 +480,278 @@ class ReplicaExchangeBase(object):
             verbose output
         verbose_count: int, default=10
             number of verbose output
+        sink: ChunkSink, optional
+            write the history to disk every `sink.chunk_size` rows;
+            the written rows are dropped from memory (and from `sample_j_n_k` etc.)
+        burnin: int, default=0
+            steps before `burnin`-th (counted by `loop_count`) are not recorded,
+            nor the initial state (step 0) if `burnin` > 0 in the first call
+        thin: int, default=1
+            record every `thin`-th step after `burnin`
+        checkpoint: str, optional
+            file to write the checkpoint (see `checkpoint`) at the end
+        checkpoint_interval: int, optional
+            also write the checkpoint every `checkpoint_interval` steps
+        tune: int, default=0
+            steps before `tune`-th (counted by `loop_count`) are the warm-up,
+            in which `eps_j_k` is adapted every `TUNE_INTERVAL` steps by `adapt_eps`;
+            `eps_j_k` is fixed after that, so that the later steps are a valid chain
+            (use `burnin` not to record the warm-up)
+        target_accept: float, optional
+            target acceptance rate of `adapt_eps`
+        tune_ladder: bool|str, default=False
+            also move the interior betas in the warm-up by `adapt_ladder`;
+            True tunes each chain by its own swap rates, so that the chains end on
+            different ladders, and the same index of beta is not the same temperature
+            in all chains (`evidence` uses the ladder of each chain, `PopulationAnnealing`
+            that of the first chain, and `rhat` refuses the chains on different ladders);
+            "shared" tunes one ladder for all chains by the swap rates averaged over them
+        moments: bool, default=False
+            add the samples of all replicas from `burnin`-th step on (not thinned)
+            to `moments` (`RunningMoments`, created at first)
+        evidence: bool, default=False
+            add `lcp` of all replicas from `burnin`-th step on (not thinned)
+            to `evidence` (`EvidenceAccumulator`, created with the ladder of each chain
+            at the first row added); the betas of no chain may move after that
+            (`burnin` >= `tune` with `tune_ladder`)
+        history: bool, default=True
+            record the history; if False, nothing is recorded and only the running
+            statistics (`stats`, `moments`, `evidence`) are updated, so that memory does not grow
+        asynchronous: bool, default=False
+            after the warm-up, run the cycles by `update_async` on the pool of
+            `n_threads` or `n_workers`, without waiting for all replicas at each exchange;
+            the result is the same
         """
+        if thin < 1:
+            raise ValueError(
+                f"thin must be positive but this is {thin}"
+            )
+        if tune_ladder not in (False, True, "shared"):
+            raise ValueError(
+                f"tune_ladder must be False, True or 'shared' but this is {tune_ladder}"
+            )
+        if evidence and tune_ladder and self.n_beta > 1 and max(burnin, self.loop_count) < tune:
+            raise ValueError(
+                f"evidence needs fixed betas, but the ladder is tuned until step {tune} "
+                f"and burnin is {burnin}; set burnin >= tune"
+            )
+        if asynchronous:
+            if self.n_threads is None and self.n_workers is None:
+                raise ValueError(
+                    "asynchronous needs n_threads or n_workers"
+                )
+            if self.exchange_scheme == "random" or self.swap_sweeps > 1:
+                raise ValueError(
+                    "asynchronous needs exchange_scheme 'deo' or 'seo' with swap_sweeps=1"
+                )
+        if moments and self.moments is None:
+            self.moments = RunningMoments(self.n_temp, self.n_dim)
+        if self.loop_count == 1 and burnin > 0:
+            # the initial state written by `__init__` is the step 0, in the burn-in as well
+            self.storage.truncate(0)
+        n_rows = self.storage.length\
+            - (-max(loopcount + self.exchange_step - max(self.loop_count, burnin), 0) // thin)
+        if sink is not None:
+            n_rows = min(n_rows, sink.chunk_size + self.exchange_step)
+            sink.open(self)
+        if history:
+            self.storage.reserve(n_rows)
+        if burnin > self.loop_count or thin > 1 or self.record_index.size < self.n_temp\
+                or not history:
+            # one exchange cycle of all replicas, recorded after each exchange
+            self.buffer = SampleStorage(self.n_temp, self.n_dim, chunk_size=self.exchange_step)
         last_verbose = self.loop_count
         verbose_interval = loopcount // verbose_count
-        while self.loop_count < loopcount:
-            self.update_parallel(self.exchange_step - 1)
-            self.update_exhange()
-            if verbose and self.loop_count >= last_verbose + verbose_interval:
-                self.verbose()
-                last_verbose = self.loop_count
+        last_checkpoint = self.loop_count
+        try:
+            while self.loop_count < loopcount:
+                cycle_start = self.loop_count
+                if asynchronous and self.loop_count >= tune and self.n_beta > 1:
+                    self.update_async(min(
+                        ASYNC_ROUNDS, -(-(loopcount - self.loop_count) // self.exchange_step)))
+                else:
+                    if self.loop_count < tune:
+                        self.update_parallel_tune(self.exchange_step - 1, tune, target_accept)
+                    else:
+                        self.update_parallel(self.exchange_step - 1)
+                    self.stats.count_steps(
+                        self.buffer.accept_j_n_k[:, self.buffer.length - (self.exchange_step - 1):])
+                    tuning_ladder = tune_ladder and self.loop_count < tune and self.n_beta > 1
+                    if tuning_ladder:
+                        self.count_swap()
+                    self.update_exhange()
+                    if tuning_ladder and self.n_swap >= LADDER_ROUND * 2**self.n_ladder:
+                        self.adapt_ladder(shared=tune_ladder == "shared")
+                if moments or evidence:
+                    self.accumulate(self.loop_count - cycle_start, burnin, moments, evidence)
+                if self.buffer is not self.storage:
+                    if history:
+                        self.record(burnin, thin)
+                    else:
+                        self.buffer.discard(self.buffer.length)
+                while sink is not None and self.storage.length >= sink.chunk_size:
+                    self.flush(sink, sink.chunk_size)
+                if checkpoint is not None and checkpoint_interval is not None\
+                        and self.loop_count >= last_checkpoint + checkpoint_interval:
+                    if sink is not None:
+                        self.flush(sink, self.storage.length)
+                    self.checkpoint(checkpoint)
+                    last_checkpoint = self.loop_count
+                if verbose and self.loop_count >= last_verbose + verbose_interval:
+                    self.verbose()
+                    last_verbose = self.loop_count
+        finally:
+            self.close_pool()
+            if self.buffer is not self.storage:
+                if history:
+                    self.record(burnin, thin)
+                self.buffer = self.storage
+            if sink is not None:
+                self.flush(sink, self.storage.length)
+                # with the tuned `eps_j_k`
+                sink.write_meta(self)
+                sink.close()
+        if checkpoint is not None:
+            self.checkpoint(checkpoint)
         if verbose and self.loop_count == last_verbose + verbose_interval:
             self.verbose()
 
+    def checkpoint(self, path):
+        """
+        save the state to continue the run by `resume`
+
+        Only the current state and the settings are saved, not the history,
+        so that it is cheap enough to call often. With a `ChunkSink`, the history
+        up to the checkpoint is on disk, and a resumed run appends to it.
+        Written to a temporary file and then renamed, not to break the previous
+        checkpoint if interrupted.
+
+        Parameters
+        ----------
+        path: str
+            file to write
+        """
+        state = self.__dict__.copy()
+        # history is not saved, but its length to continue the sink
+        storage = SampleStorage(self.n_temp, self.n_dim, n_record=self.record_index.size)
+        storage.n_discarded = self.storage.n_discarded + self.storage.length
+        state["storage"] = state["buffer"] = storage
+        state["executor"] = None
+        state["process_pool"] = None
+        path = os.path.abspath(path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", mode="wb") as f:
+            pickle.dump({
+                "class": type(self),
+                "state": state,
+            }, f)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def resume(cls, path):
+        """
+        restore a sampler saved by `checkpoint`
+
+        The random number generators are restored with the sampler, so that calling
+        `sampling` with the same arguments continues exactly as the uninterrupted run.
+
+        Parameters
+        ----------
+        path: str
+            checkpoint file
+
+        Returns
+        -------
+        ReplicaExchangeBase
+            sampler with empty history (`storage.n_discarded` rows were recorded before)
+        """
+        with open(path, mode="rb") as f:
+            data = pickle.load(f)
+        if not issubclass(data["class"], cls):
+            raise ValueError(
+                f"checkpoint of {data['class'].__name__} cannot be resumed as {cls.__name__}"
+            )
+        sampler = data["class"].__new__(data["class"])
+        sampler.__dict__.update(data["state"])
+        return sampler
+
+    def record(self, burnin, thin):
+        """
+        move the rows of `buffer` to the storage, only those to be recorded
+
+        Parameters
+        ----------
+        burnin: int
+            steps before `burnin`-th are not recorded
+        thin: int
+            record every `thin`-th step after `burnin`
+        """
+        buffer = self.buffer
+        n_start = self.loop_count - buffer.length
+        index_n = np.arange(max(n_start, burnin), self.loop_count)
+        index_n = index_n[(index_n - burnin) % thin == 0] - n_start
+        n = self.storage.extend(index_n.size)
+        self.storage.sample_j_n_k[:, n:] = buffer.sample_j_n_k[self.record_index][:, index_n]
+        self.storage.lcp_sample_n_k[:, n:] = buffer.lcp_sample_n_k[:, index_n]
+        self.storage.lpp_sample_n_k[:, n:] = buffer.lpp_sample_n_k[:, index_n]
+        self.storage.ll_sample_n_k[:, n:] = buffer.ll_sample_n_k[:, index_n]
+        self.storage.accept_j_n_k[:, n:] = buffer.accept_j_n_k[self.record_index][:, index_n]
+        self.storage.exchange_accept_n_k[:, n:] = buffer.exchange_accept_n_k[:, index_n]
+        self.storage.walker_n_k[:, n:] = buffer.walker_n_k[:, index_n]
+        buffer.discard(buffer.length)
+
+    def accumulate(self, n_rows, burnin, moments=True, evidence=False):
+        """
+        add the last `n_rows` rows of `buffer`, those from `burnin`-th step on,
+        to `moments` and `evidence`
+
+        Parameters
+        ----------
+        n_rows: int
+            number of the rows written since the last call
+        burnin: int
+            steps before `burnin`-th are not added
+        moments: bool, default=True
+            add the samples to `moments`
+        evidence: bool, default=False
+            add lcp to `evidence`
+        """
+        n_rows = min(n_rows, self.loop_count - burnin)
+        if n_rows <= 0:
+            return
+        if moments:
+            self.moments.update(self.buffer.sample_j_n_k[:, self.buffer.length - n_rows:])
+        if evidence:
+            # ladder of each chain, which differ after `adapt_ladder`
+            beta_k_c = np.asarray(self.beta_k, dtype=np.float64).reshape(self.n_chain, self.n_beta)
+            if self.evidence is None:
+                self.evidence = EvidenceAccumulator(beta_k_c)
+            elif not np.array_equal(self.evidence.beta_k_c, beta_k_c):
+                raise ValueError(
+                    f"betas moved from {self.evidence.beta_k_c} to {beta_k_c} after evidence started"
+                )
+            self.evidence.update(self.buffer.lcp_sample_n_k[:, self.buffer.length - n_rows:])
+
+    def flush(self, sink, n_rows):
+        """
+        write the first `n_rows` rows of the history to `sink` and drop them from memory
+
+        Parameters
+        ----------
+        sink: ChunkSink
+            opened sink
+        n_rows: int
+            number of rows to write
+        """
+        sink.write(self.storage, n_rows)
+        self.storage.discard(n_rows)
+
+    def close_pool(self):
+        """stop worker processes of `n_workers`, if running"""
+        if self.process_pool is not None:
+            self.process_pool.close()
+            self.process_pool = None
+
     def update_parallel(self, batch):
         """
         update new sample with M-H step for each betas
@@ -160,13 +763,25 @@ class ReplicaExchangeBase(object):
             number of continuus calculation
         """
         #print("update parallel")
+        if self.engine == "numba":
+            self.update_parallel_numba(batch)
+            return
+        if self.engine == "vectorized":
+            self.update_parallel_vectorized(batch)
+            return
+        if self.n_workers is not None:
+            self.update_parallel_processes(batch)
+            return
+        n = self.buffer.extend(batch)
         for k,beta in enumerate(self.beta_k):
+            w = self.walker_k[k]
             param_j_s, lcp_s, lpp_s, ll_s, accept_j_s = self.get_batch(
-                self.sample_j_n_k[k][-1],
-                self.lcp_sample_n_k[k][-1],
-                self.lpp_sample_n_k[k][-1],
-                self.ll_sample_n_k[k][-1],
-                beta, batch
+                self.param_j_w[w].tolist(),
+                self.lcp_w[w],
+                self.lpp_w[w],
+                self.ll_w[w],
+                beta, self.eps_j_k[k], batch, self.rng_k[k],
+                *((self.lcp_term_t_w[w], self.lpp_term_t_w[w]) if self.cached_terms else ())
             )
             assert shape(param_j_s)==(batch, self.n_dim),\
                 f"param_j_s {np.array(param_j_s).shape}"
@@ -176,20 +791,499 @@ class ReplicaExchangeBase(object):
                 f"lpp_s {np.array(lpp_s).shape}"
             assert shape(ll_s)==(batch,),\
                 f"ll_s {np.array(ll_s).shape}"
-            self.sample_j_n_k[k] += param_j_s
-            self.lcp_sample_n_k[k] += lcp_s
-            self.lpp_sample_n_k[k] += lpp_s
-            self.ll_sample_n_k[k] += ll_s
-            self.accept_j_n_k[k] += accept_j_s
+            self.buffer.sample_j_n_k[k, n:n+batch] = param_j_s
+            self.buffer.lcp_sample_n_k[k, n:n+batch] = lcp_s
+            self.buffer.lpp_sample_n_k[k, n:n+batch] = lpp_s
+            self.buffer.ll_sample_n_k[k, n:n+batch] = ll_s
+            self.buffer.accept_j_n_k[k, n:n+batch] = accept_j_s
             if k<self.n_temp-1:
-                self.exchange_accept_n_k[k] += [-1] * batch
+                self.buffer.exchange_accept_n_k[k, n:n+batch] = -1
+        self.buffer.walker_n_k[:, n:n+batch] = self.walker_k[:, np.newaxis]
+        if batch > 0:
+            self.param_j_w[self.walker_k] = self.buffer.sample_j_n_k[:, -1]
+            self.lcp_w[self.walker_k] = self.buffer.lcp_sample_n_k[:, -1]
+            self.lpp_w[self.walker_k] = self.buffer.lpp_sample_n_k[:, -1]
+            self.ll_w[self.walker_k] = self.buffer.ll_sample_n_k[:, -1]
         self.loop_count += batch
-        assert shape(self.sample_j_n_k)==(self.n_temp, self.loop_count, self.n_dim),\
-            f"sample_j_n_k {shape(self.sample_j_n_k)}, {np.array(self.sample_j_n_k)}, {self.loop_count}"
-        assert shape(self.ll_sample_n_k)==(self.n_temp, self.loop_count),\
-            f"ll_sample_n_k {shape(self.ll_sample_n_k)}, {np.array(self.ll_sample_n_k)}, {self.loop_count}"
+        assert self.buffer.sample_j_n_k.shape==(self.n_temp, n + batch, self.n_dim),\
+            f"sample_j_n_k {self.buffer.sample_j_n_k.shape}, {self.loop_count}"
+        assert self.buffer.ll_sample_n_k.shape==(self.n_temp, n + batch),\
+            f"ll_sample_n_k {self.buffer.ll_sample_n_k.shape}, {self.loop_count}"
+
+    def update_parallel_tune(self, batch, tune, target_accept=None):
+        """
+        `update_parallel` in the warm-up, adapting `eps_j_k` by `adapt_eps`
+
+        The steps are updated in windows of at most `TUNE_INTERVAL` steps,
+        each followed by an update of `eps_j_k`. The last window ends at `tune`-th step,
+        and the rest of `batch` is updated with the final `eps_j_k`.
+
+        Parameters
+        ----------
+        batch: int
+            number of continuus calculation
+        tune: int
+            steps before `tune`-th are the warm-up
+        target_accept: float, optional
+            target acceptance rate
+        """
+        while batch > 0 and self.loop_count < tune:
+            window = min(batch, TUNE_INTERVAL, tune - self.loop_count)
+            self.update_parallel(window)
+            self.adapt_eps(window, target_accept)
+            batch -= window
+        if batch > 0:
+            self.update_parallel(batch)
+
+    def adapt_eps(self, window, target_accept=None):
+        """
+        tune the step width of each replica toward the target acceptance rate
+
+        Robbins-Monro step of log(eps) by the acceptance rate of the last `window` steps,
+        counted on those rows of the buffer only, with a gain decreasing as 1/sqrt(n)
+        in the n-th update. Each replica (of each chain) is tuned independently.
+
+        Parameters
+        ----------
+        window: int
+            number of the steps since the last update
+        target_accept: float, optional
+            target acceptance rate, 0.44 for single parameter blocks
+            and 0.234 for larger blocks if not given
+        """
+        if target_accept is None:
+            target_j = np.empty(self.n_dim)
+            for j_b in self.block_b:
+                target_j[j_b] = 0.44 if len(j_b) == 1 else 0.234
+        else:
+            target_j = np.full(self.n_dim, target_accept)
+        accept_j_k = (self.buffer.accept_j_n_k[:, -window:] == 1).sum(axis=1) / window
+        self.n_adapt += 1
+        self.eps_j_k = np.asarray(self.eps_j_k, dtype=np.float64)\
+            * np.exp((accept_j_k - target_j) / np.sqrt(self.n_adapt))
+        self.n_tune = self.loop_count
 
-    def get_batch(self, param_j_pre, lcp_pre, lpp_pre, ll_pre, beta, batch):
+    def count_swap(self):
+        """
+        add the swap probabilities of all neighbouring pairs in the current state,
+        whether the pair is tried in this exchange or not, for `adapt_ladder`
+        """
+        beta_l_c = np.asarray(self.beta_k, dtype=np.float64).reshape(self.n_chain, self.n_beta)
+        lcp_l_c = self.lcp_w[self.walker_k].reshape(self.n_chain, self.n_beta)
+        with np.errstate(invalid="ignore"):
+            log_prob_l_c = (beta_l_c[:, :-1] - beta_l_c[:, 1:]) * (lcp_l_c[:, 1:] - lcp_l_c[:, :-1])
+        self.swap_prob_sum_l_c += np.exp(np.minimum(np.nan_to_num(log_prob_l_c), 0))
+        self.n_swap += 1
+
+    def adapt_ladder(self, shared=False):
+        """
+        move the interior betas of each chain to equalize the swap rates of neighbouring pairs
+
+        The rejection rates (1 - swap rate) summed along the ladder estimate
+        the communication barrier between both ends, as a function of beta
+        (piecewise linear in log(beta), or in beta if some beta is not positive).
+        The new betas divide it equally, which maximizes the rate of round trips
+        in the limit of many temperatures (Syed et al. 2019).
+        The ends of the ladder and the betas of 1 (the target distribution, e.g. inside
+        a ladder which goes on to beta > 1) are fixed, and the betas between two fixed ones
+        divide the barrier between them equally. `eps_j_k` is interpolated in log-log scale
+        and the log likelihoods are recalculated for the new betas.
+        Rounds double in length (`LADDER_ROUND` exchanges at first),
+        and the mean swap probabilities of the last round are kept in `swap_prob_l_c`.
+        Each chain is moved by its own swap rates, so that the chains end on different
+        ladders, unless `shared`.
+
+        Parameters
+        ----------
+        shared: bool, default=False
+            move all chains, which must be on the same ladder, by the swap rates
+            averaged over the chains, so that they stay on the same ladder
+        """
+        self.swap_prob_l_c = self.swap_prob_sum_l_c / self.n_swap
+        # copies, not to change the arrays given by the user
+        beta_l_c = np.array(self.beta_k, dtype=np.float64).reshape(self.n_chain, self.n_beta)
+        if shared and not (beta_l_c == beta_l_c[0]).all():
+            raise ValueError(
+                f"shared ladder needs the same betas in all chains but these are {beta_l_c}"
+            )
+        swap_prob_l_c = np.broadcast_to(self.swap_prob_l_c.mean(axis=0), self.swap_prob_l_c.shape)\
+            if shared else self.swap_prob_l_c
+        eps_j_l_c = np.array(self.eps_j_k, dtype=np.float64).reshape(
+            self.n_chain, self.n_beta, self.n_dim)
+        log_scale = (beta_l_c > 0).all()
+        for c in range(self.n_chain):
+            barrier_l = np.concatenate([
+                [0], np.cumsum(np.maximum(1 - swap_prob_l_c[c], 1e-6))])
+            x_l = np.log(beta_l_c[c]) if log_scale else beta_l_c[c]
+            fixed_l = np.unique(np.concatenate([
+                [0, self.n_beta - 1], np.flatnonzero(beta_l_c[c] == 1)]))
+            barrier_new_l = np.concatenate([
+                np.linspace(barrier_l[l0], barrier_l[l1], l1 - l0 + 1)[:-1]
+                for l0, l1 in zip(fixed_l[:-1], fixed_l[1:])
+            ] + [barrier_l[-1:]])
+            x_new_l = np.interp(barrier_new_l, barrier_l, x_l)
+            order = np.argsort(x_l)
+            eps_j_l_c[c] = np.exp([
+                np.interp(x_new_l, x_l[order], np.log(eps_j_l[order]))
+                for eps_j_l in eps_j_l_c[c].T
+            ]).T
+            # the fixed betas are kept exactly
+            free_l = np.ones(self.n_beta, dtype=bool)
+            free_l[fixed_l] = False
+            beta_l_c[c, free_l] = (np.exp(x_new_l) if log_scale else x_new_l)[free_l]
+        self.beta_k = beta_l_c.ravel()
+        self.eps_j_k = eps_j_l_c.reshape(self.n_temp, self.n_dim)
+        self.ll_w[self.walker_k] = self.lcp_w[self.walker_k] * self.beta_k + self.lpp_w[self.walker_k]
+        self.swap_prob_sum_l_c[:] = 0
+        self.n_swap = 0
+        self.n_ladder += 1
+
+    def suggest_n_beta(self, swap_rate):
+        """
+        number of betas for which the swap rate of neighbouring pairs would be `swap_rate`
+
+        Estimated from the communication barrier of the last round of `adapt_ladder`
+        (mean of the chains), with the betas dividing it equally.
+
+        Parameters
+        ----------
+        swap_rate: float
+            target swap rate of neighbouring pairs, in (0, 1)
+
+        Returns
+        -------
+        int
+            minimal number of betas
+        """
+        if not 0 < swap_rate < 1:
+            raise ValueError(
+                f"swap_rate must be in (0, 1) but this is {swap_rate}"
+            )
+        if self.swap_prob_l_c is None:
+            raise ValueError(
+                "no estimate of swap rates, run `sampling` with tune_ladder=True"
+            )
+        barrier = (1 - self.swap_prob_l_c).sum(axis=1).mean()
+        return max(int(np.ceil(barrier / (1 - swap_rate))) + 1, 2)
+
+    def update_parallel_numba(self, batch):
+        """
+        `update_parallel` by compiled `sweep_replica` (or `sweep_separable`, `sweep_factor`)
+
+        Each replica is updated in a single compiled call with its own random number
+        generator (`rng_k`), drawing the same numbers in the same order as the python path
+        (`draw_steps`).
+        With `n_threads`, the replicas are updated in a thread pool and joined before
+        returning. The compiled kernels release the GIL, so that the model functions
+        given by `compiled_model` run in parallel.
+        The result does not depend on `n_threads`.
+
+        Parameters
+        ----------
+        batch: int
+            number of continuus calculation
+        """
+        n = self.buffer.extend(batch)
+        kernel, model, args = self.compiled_sweep()
+        if self.n_threads is None:
+            for k in range(self.n_temp):
+                kernel(*model, k, *args, n, batch, self.rng_k[k])
+        else:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.n_threads)
+            futures = [
+                self.executor.submit(kernel, *model, k, *args, n, batch, self.rng_k[k])
+                for k in range(self.n_temp)
+            ]
+            for future in futures:
+                future.result()
+        self.buffer.exchange_accept_n_k[:, n:n+batch] = -1
+        self.buffer.walker_n_k[:, n:n+batch] = self.walker_k[:, np.newaxis]
+        self.loop_count += batch
+
+    def compiled_sweep(self):
+        """
+        compiled kernel of the model for the numba engine, with its arguments
+
+        The kernel of k-th replica is called as
+        `kernel(*model, k, *args, n_start, batch, rng_k[k])`,
+        writing to the rows of `buffer` allocated at the time of this call.
+
+        Returns
+        -------
+        kernel: njit function
+            `sweep_replica`, `sweep_separable`, `sweep_factor` or `sweep_factor_colour`
+        model: tuple
+            functions of the model and their arguments
+        args: tuple
+            settings, current state and history
+        """
+        block_ptr_b = np.cumsum([0] + [len(j_b) for j_b in self.block_b])
+        block_index = np.concatenate(self.block_b)
+        history = (
+            self.buffer.sample_j_n_k, self.buffer.lcp_sample_n_k,
+            self.buffer.lpp_sample_n_k, self.buffer.ll_sample_n_k,
+            self.buffer.accept_j_n_k
+        )
+        if self.factorized:
+            condprob_factors = self.condprob_factors
+            priorprob_factors = self.priorprob_factors
+            if self.colour_c is not None:
+                block_ptr_b = np.cumsum([0] + [len(j_c) for j_c in self.colour_c])
+                block_index = np.concatenate(self.colour_c)
+            kernel = sweep_factor if self.colour_c is None else sweep_factor_colour
+            model = (
+                condprob_factors.log_factor, condprob_factors.args,
+                condprob_factors.factor_ptr_j, condprob_factors.factor_index,
+                priorprob_factors.log_factor, priorprob_factors.args,
+                priorprob_factors.factor_ptr_j, priorprob_factors.factor_index
+            )
+        elif self.separable:
+            kernel = sweep_separable
+            model = self.compiled_model_term()
+        else:
+            kernel = sweep_replica
+            model = self.compiled_model()
+        terms = (self.lcp_term_t_w, self.lpp_term_t_w) if self.cached_terms else ()
+        args = (
+            np.asarray(self.beta_k, dtype=np.float64),
+            np.asarray(self.eps_j_k, dtype=np.float64),
+            block_ptr_b, block_index, self.walker_k,
+            self.param_j_w, self.lcp_w, self.lpp_w, self.ll_w,
+            *terms, *history
+        )
+        return kernel, model, args
+
+    def update_parallel_processes(self, batch):
+        """
+        `update_parallel` by worker processes of `ReplicaProcessPool`
+
+        For models whose functions hold the GIL. Workers run the python path
+        of the replicas assigned to them, each replica with its own random number
+        generator (`rng_k`), so the result does not depend on `n_workers`.
+        The workers are kept until the end of `sampling`.
+
+        Parameters
+        ----------
+        batch: int
+            number of continuus calculation
+        """
+        if batch == 0:
+            return
+        if self.process_pool is None:
+            self.process_pool = ReplicaProcessPool(
+                self, self.n_workers, max(self.exchange_step - 1, batch))
+        n = self.process_pool.run(self, batch)
+        self.buffer.exchange_accept_n_k[:, n:n+batch] = -1
+        self.buffer.walker_n_k[:, n:n+batch] = self.walker_k[:, np.newaxis]
+        self.loop_count += batch
+
+    def update_async(self, n_round):
+        """
+        `n_round` cycles of M-H steps and exchange, without the barrier between the cycles
+
+        Event-driven version of `update_parallel` and `update_exhange` for replicas
+        of different (or varying) cost, run on the thread pool of `n_threads`
+        (numba engine) or the worker processes of `n_workers`.
+        A replica starts the steps of its next cycle as soon as the exchange of
+        the last cycle is done, which waits only for its partner of the exchange,
+        not for all replicas, so that fast replicas run ahead of slow ones.
+        The pairs and the random numbers of the exchanges are fixed in advance
+        in the order of the cycles, not by the timing of the replicas,
+        which would depend on their states and bias the exchanges (e.g. toward cheap regions).
+        So every step is done on the same state as in the synchronous cycles,
+        detailed balance holds as there, and the result is the same.
+
+        Parameters
+        ----------
+        n_round: int
+            number of cycles of `exchange_step` steps
+        """
+        batch = self.exchange_step - 1
+        n_beta = self.n_beta
+        beta_k = np.asarray(self.beta_k, dtype=np.float64)
+        buffer = self.buffer
+        n_start = buffer.extend(n_round * self.exchange_step)
+        # parity and uniform variates of the exchanges of each chain, in the order of the cycles
+        parity_r_c = np.empty((self.n_chain, n_round), dtype=np.int64)
+        log_u_l_r_c = np.empty((self.n_chain, n_round, n_beta - 1))
+        for c, rng in enumerate(self.rng_c):
+            for r in range(n_round):
+                if self.exchange_scheme == "seo":
+                    parity_r_c[c, r] = rng.integers(2)
+                else:
+                    parity_r_c[c, r] = (self.exchange_count + r) % 2
+                with np.errstate(divide="ignore"):
+                    log_u_l_r_c[c, r] = np.log(rng.random(n_beta - 1))
+        # rows of the exchanges, no exchange between the last replica of a chain and the first of the next
+        row_r = n_start + np.arange(n_round) * self.exchange_step + batch
+        boundary_k = np.arange(self.n_temp - 1) % n_beta == n_beta - 1
+        buffer.exchange_accept_n_k[:, n_start:] = -1
+        buffer.exchange_accept_n_k[:, row_r] = np.where(boundary_k, -1, 0)[:, np.newaxis]
+
+        if self.n_threads is not None:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.n_threads)
+            kernel, model, args = self.compiled_sweep()
+            futures = {}
+
+            def submit(k, n):
+                futures[self.executor.submit(kernel, *model, k, *args, n, batch, self.rng_k[k])] = k
+
+            def wait():
+                done, _ = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+                return [futures.pop(future) for future in done]
+        else:
+            if self.process_pool is None:
+                self.process_pool = ReplicaProcessPool(self, self.n_workers, batch)
+
+            def submit(k, n):
+                self.process_pool.submit(self, k, n, batch)
+
+            def wait():
+                return self.process_pool.wait(self)
+
+        round_k = np.zeros(self.n_temp, dtype=np.int64)
+        waiting_k = np.zeros(self.n_temp, dtype=bool)
+        ready = []
+
+        def start(k):
+            n = n_start + round_k[k] * self.exchange_step
+            buffer.walker_n_k[k, n:n + batch] = self.walker_k[k]
+            if batch > 0:
+                submit(k, n)
+            else:
+                ready.append(k)
+
+        for k in range(self.n_temp):
+            start(k)
+        n_done = 0
+        while n_done < self.n_temp:
+            if not ready:
+                ready += wait()
+            k = ready.pop()
+            r = round_k[k]
+            c, l = divmod(k, n_beta)
+            # partner in this cycle, in the pair (l1, l1 + 1) of the parity
+            if l % 2 == parity_r_c[c, r] and l < n_beta - 1:
+                q = k + 1
+            elif (l - 1) % 2 == parity_r_c[c, r] and l > 0:
+                q = k - 1
+            else:
+                q = None
+            if q is not None and not (waiting_k[q] and round_k[q] == r):
+                waiting_k[k] = True
+                continue
+            if q is None:
+                pair = (k,)
+            else:
+                waiting_k[q] = False
+                k1, k2 = min(k, q), max(k, q)
+                pair = (k1, k2)
+                w1, w2 = self.walker_k[k1], self.walker_k[k2]
+                lcp_pre1 = self.lcp_w[w1]
+                lcp_pre2 = self.lcp_w[w2]
+                if self.swap_test(
+                    lcp_pre1 * beta_k[k1] + lcp_pre2 * beta_k[k2],
+                    lcp_pre2 * beta_k[k1] + lcp_pre1 * beta_k[k2],
+                    log_u_l_r_c[c, r, k1 % n_beta]
+                ):
+                    self.walker_k[k1], self.walker_k[k2] = w2, w1
+                    self.ll_w[w2] = self.lcp_w[w2] * beta_k[k1] + self.lpp_w[w2]
+                    self.ll_w[w1] = self.lcp_w[w1] * beta_k[k2] + self.lpp_w[w1]
+                    buffer.exchange_accept_n_k[k1, row_r[r]] = 1
+            for k in pair:
+                n = row_r[r]
+                w = self.walker_k[k]
+                buffer.sample_j_n_k[k, n] = self.param_j_w[w]
+                buffer.lcp_sample_n_k[k, n] = self.lcp_w[w]
+                buffer.lpp_sample_n_k[k, n] = self.lpp_w[w]
+                buffer.ll_sample_n_k[k, n] = self.ll_w[w]
+                buffer.accept_j_n_k[k, n] = -1
+                buffer.walker_n_k[k, n] = w
+                round_k[k] += 1
+                if round_k[k] < n_round:
+                    start(k)
+                else:
+                    n_done += 1
+
+        # running statistics, as by the synchronous cycles
+        for r in range(n_round):
+            n = row_r[r]
+            self.stats.count_steps(buffer.accept_j_n_k[:, n - batch:n])
+            try_k = (np.arange(self.n_temp - 1) % n_beta % 2
+                     == np.repeat(parity_r_c[:, r], n_beta)[:-1]) & ~boundary_k
+            self.stats.count_exchange(
+                try_k.astype(np.int64), np.maximum(buffer.exchange_accept_n_k[:, n], 0),
+                buffer.walker_n_k[:, n])
+        self.loop_count += n_round * self.exchange_step
+        self.exchange_count += n_round
+
+    def update_parallel_vectorized(self, batch):
+        """
+        `update_parallel` with the batched model
+
+        Each block is suggested for all replicas at once,
+        so that `log_condprob_batch` and `log_priorprob_batch` are called once per block
+        and the Metropolis tests of all replicas are done in one array operation.
+        The random numbers are drawn from the stream of each replica by `draw_steps`,
+        in the same blocks of rows as the other engines.
+
+        Parameters
+        ----------
+        batch: int
+            number of continuus calculation
+        """
+        beta_k = np.asarray(self.beta_k, dtype=np.float64)
+        eps_j_k = np.asarray(self.eps_j_k, dtype=np.float64)
+        # state in the order of replicas, written back to the walkers at the end
+        param_j_k = self.param_j_k
+        lcp_k = self.lcp_k
+        lpp_k = self.lpp_k
+        ll_k = self.ll_k
+        n_block = len(self.block_b)
+        n_rows = random_rows(self.n_dim, n_block)
+        n_start = self.buffer.extend(batch)
+        accept_j_n_k = self.buffer.accept_j_n_k
+        for n in range(n_start, n_start + batch):
+            s = (n - n_start) % n_rows
+            if s == 0:
+                m = min(n_rows, n_start + batch - n)
+                draws_k = [
+                    draw_steps(self.rng_k[k], eps_j_k[k], n_block, m) for k in range(self.n_temp)]
+                step_j_k_s = np.stack([step_j_s for step_j_s, _log_u_b_s in draws_k], axis=1)
+                log_u_k_b_s = np.stack([log_u_b_s for _step_j_s, log_u_b_s in draws_k], axis=2)
+            for b, j_b in enumerate(self.block_b):
+                param_new_j_k = param_j_k.copy()
+                param_new_j_k[:, j_b] += step_j_k_s[s][:, j_b]
+                lcp_new_k = self.log_condprob_batch(param_new_j_k)
+                lpp_new_k = self.log_priorprob_batch(param_new_j_k)
+                ll_new_k = lcp_new_k * beta_k + lpp_new_k
+                with np.errstate(invalid="ignore"):
+                    accept_k = (ll_new_k >= ll_k) | (log_u_k_b_s[s, b] < ll_new_k - ll_k)
+                param_j_k[accept_k] = param_new_j_k[accept_k]
+                lcp_k[accept_k] = lcp_new_k[accept_k]
+                lpp_k[accept_k] = lpp_new_k[accept_k]
+                ll_k[accept_k] = ll_new_k[accept_k]
+                accept_j_n_k[:, n, j_b] = accept_k[:, np.newaxis]
+            self.buffer.sample_j_n_k[:, n] = param_j_k
+            self.buffer.lcp_sample_n_k[:, n] = lcp_k
+            self.buffer.lpp_sample_n_k[:, n] = lpp_k
+            self.buffer.ll_sample_n_k[:, n] = ll_k
+            self.buffer.exchange_accept_n_k[:, n] = -1
+            self.buffer.walker_n_k[:, n] = self.walker_k
+        self.param_j_w[self.walker_k] = param_j_k
+        self.lcp_w[self.walker_k] = lcp_k
+        self.lpp_w[self.walker_k] = lpp_k
+        self.ll_w[self.walker_k] = ll_k
+        self.loop_count += batch
+
+    def get_batch(
+        self, param_j_pre, lcp_pre, lpp_pre, ll_pre, beta, eps_j, batch, rng,
+        lcp_term=None, lpp_term=None
+    ):
         """
         get new sample at beta_k[k] with M-H step for each betas
 
@@ -201,8 +1295,16 @@ class ReplicaExchangeBase(object):
             previous log likelihood
         beta: float (in self.beta_k)
             Target temperature for calculation
+        eps_j: list[float] (N_dim,)
+            step width of the replica
         batch: int
             number of continuus calculation
+        rng: np.random.Generator
+            random number generator of the replica,
+            from which the random numbers of the steps are drawn in blocks by `draw_steps`
+        lcp_term, lpp_term: np.ndarray, optional
+            terms of the previous sample for separable or factorized model,
+            updated in place
 
         Returns
         -------
@@ -215,10 +1317,19 @@ class ReplicaExchangeBase(object):
         lpp_s = []
         ll_s = []
         accept_j_s = []
+        eps_j = np.asarray(eps_j, dtype=np.float64)
+        n_block = len(self.block_b)
+        n_rows = random_rows(self.n_dim, n_block)
         #loop_count = self.loop_count
-        for _ in range(batch):
+        for i in range(batch):
+            s = i % n_rows
+            if s == 0:
+                step_j_s, log_u_b_s = draw_steps(rng, eps_j, n_block, min(n_rows, batch - i))
+                step_j_s = step_j_s.tolist()
+                log_u_b_s = log_u_b_s.tolist()
             param_j_pre, lcp_pre, lpp_pre, ll_pre, accept_j = self.get_next(
-                param_j_pre, lcp_pre, lpp_pre, ll_pre, beta
+                param_j_pre, lcp_pre, lpp_pre, ll_pre, beta, step_j_s[s], log_u_b_s[s],
+                lcp_term, lpp_term
             )
             param_j_s += [param_j_pre]
             lcp_s += [lcp_pre]
@@ -230,10 +1341,17 @@ class ReplicaExchangeBase(object):
         assert shape(accept_j_s)==(batch, self.n_dim), accept_j_s
         return param_j_s, lcp_s, lpp_s, ll_s, accept_j_s
 
-    def get_next(self, param_j_pre, lcp_pre, lpp_pre, ll_pre, beta):
+    def get_next(
+        self, param_j_pre, lcp_pre, lpp_pre, ll_pre, beta, step_j, log_u_b,
+        lcp_term=None, lpp_term=None
+    ):
         """
         suggest and Metropolis test
 
+        For separable (factorized) model, only the terms (factors) depending on
+        the changed parameters are calculated and the log probabilities are
+        updated by their differences.
+
         Parameters
         ----------
         param_j_pre: list[(float|int)] (N_dim,)
@@ -242,6 +1360,13 @@ class ReplicaExchangeBase(object):
             previous log likelihood
         beta: float (in self.beta_k)
             Target temperature for calculation
+        step_j: list[float] (N_dim,)
+            gaussian steps of the suggestions
+        log_u_b: list[float] (N_block,)
+            log of uniform variates of the Metropolis tests
+        lcp_term, lpp_term: np.ndarray, optional
+            terms of the previous sample for separable or factorized model,
+            updated in place
 
         Returns
         -------
@@ -250,95 +1375,191 @@ class ReplicaExchangeBase(object):
         ll: float
             next ll
         accept_j: list[bool] (N_dim,)
-            Whether the step has been accepted for each parameter.
+            Whether the step has been accepted for each parameter,
+            the same value for the parameters in a block.
         """
         assert beta in self.beta_k
         accept_j = [0] * len(self.param_name_j)
-        for j,_ in enumerate(self.param_name_j):
-            param_j_new = self.suggestion(param_j_pre, self.beta2eps[beta], j)
-            lcp_new = self.log_condprob(param_j_new)
-            lpp_new = self.log_priorprob(param_j_new)
+        for j_b, log_u in zip(self.block_b, log_u_b):
+            param_j_new = self.suggestion(param_j_pre, step_j, j_b)
+            if lcp_term is None:
+                lcp_new = self.log_condprob(param_j_new)
+                lpp_new = self.log_priorprob(param_j_new)
+            elif self.factorized:
+                param_new = np.asarray(param_j_new, dtype=np.float64)
+                lcp_t_b = self.condprob_factors.factors_of(j_b)
+                lpp_t_b = self.priorprob_factors.factors_of(j_b)
+                lcp_term_b = [
+                    self.condprob_factors.log_factor(f, param_new, *self.condprob_factors.args)
+                    for f in lcp_t_b]
+                lpp_term_b = [
+                    self.priorprob_factors.log_factor(f, param_new, *self.priorprob_factors.args)
+                    for f in lpp_t_b]
+                lcp_new = lcp_pre + sum(lcp_term_b) - lcp_term[lcp_t_b].sum()
+                lpp_new = lpp_pre + sum(lpp_term_b) - lpp_term[lpp_t_b].sum()
+            else:
+                lcp_t_b = lpp_t_b = j_b
+                lcp_term_b = [self.log_condprob_term(param_j_new, j) for j in j_b]
+                lpp_term_b = [self.log_priorprob_term(param_j_new, j) for j in j_b]
+                lcp_new = lcp_pre + sum(lcp_term_b) - lcp_term[j_b].sum()
+                lpp_new = lpp_pre + sum(lpp_term_b) - lpp_term[j_b].sum()
             ll_new = lcp_new * beta + lpp_new
-            if self.metropolis_test(ll_pre, ll_new):
+            if self.metropolis_test(ll_pre, ll_new, log_u):
                 param_j_pre = param_j_new
                 lcp_pre = lcp_new
                 lpp_pre = lpp_new
                 ll_pre = ll_new
-                accept_j[j] = 1
+                if lcp_term is not None:
+                    lcp_term[lcp_t_b] = lcp_term_b
+                    lpp_term[lpp_t_b] = lpp_term_b
+                for j in j_b:
+                    accept_j[j] = 1
+        if lcp_term is not None:
+            # re-sum the terms once per sweep not to accumulate rounding errors
+            lcp_pre = lcp_term.sum()
+            lpp_pre = lpp_term.sum()
+            ll_pre = lcp_pre * beta + lpp_pre
         assert shape(param_j_pre)==(self.n_dim,), param_j_pre
         assert shape(accept_j)==(self.n_dim,), accept_j
         return param_j_pre, lcp_pre, lpp_pre, ll_pre, accept_j
 
     @staticmethod
-    def metropolis_test(ll_pre, ll_new):
-        """whether metropolis test accepted or rejected"""
-        return ll_new >= ll_pre or np.random.rand() <= np.exp(ll_new - ll_pre)
+    def metropolis_test(ll_pre, ll_new, log_u):
+        """whether metropolis test accepted or rejected, by log of a uniform variate"""
+        return ll_new >= ll_pre or log_u < ll_new - ll_pre
 
     def update_exhange(self):
         """
         update new sample with exchange step
+
+        `swap_sweeps` passes of `swap_sweep` over the walkers, which reuse
+        the current `lcp` of the walkers and need no evaluation of the model.
+        An accepted exchange swaps the walkers of the pair in `walker_k`,
+        and the states stay with the walkers, so that nothing but the labels
+        (and the tempered log probabilities of the walkers) is changed.
+        The exchange acceptance of a neighbouring pair is 1 if it is swapped in any pass,
+        and the swap rates (`stats`) count every pass.
         """
-        if self.n_temp==1:
+        if self.n_beta==1:
             return
         #print("update exchange")
-        param_new_j_k = [
-            self.sample_j_n_k[k][-1]
-            for k,_ in enumerate(self.beta_k)
-        ]
-        lcp_new_k = [
-            self.lcp_sample_n_k[k][-1]
-            for k,_ in enumerate(self.beta_k)
-        ]
-        lpp_new_k = [
-            self.lpp_sample_n_k[k][-1]
-            for k,_ in enumerate(self.beta_k)
-        ]
-        ll_new_k = [
-            self.ll_sample_n_k[k][-1]
-            for k,_ in enumerate(self.beta_k)
-        ]
-        ex_accept_k = [0] * (self.n_temp - 1)
-
-        # 偶数/奇数番目を交互に交換
-        for k2, beta2 in enumerate(self.beta_k):
-            if not(0 < k2 < self.n_temp):
-                continue
-            k1 = k2 - 1
-            if k1 % 2 != self.exchange_count % 2:
-                continue
-            beta1 = self.beta_k[k1]
-            lcp_pre1 = self.lcp_sample_n_k[k1][-1]
-            lcp_pre2 = self.lcp_sample_n_k[k2][-1]
-            lcp_new1, lcp_new2 = lcp_pre2, lcp_pre1
-            if self.metropolis_test(
-                lcp_pre1 * beta1 + lcp_pre2 * beta2,
-                lcp_new1 * beta1 + lcp_new2 * beta2
-            ):
-                # swap param, likelihoods
-                param_new_j_k[k1], param_new_j_k[k2] = param_new_j_k[k2], param_new_j_k[k1]
-                lcp_new_k[k1], lcp_new_k[k2] = lcp_new1, lcp_new2
-                lpp_new_k[k1], lpp_new_k[k2] = lpp_new_k[k2], lpp_new_k[k1]
-                ll_new_k[k1] = lcp_new1 * beta1 + lpp_new_k[k1]
-                ll_new_k[k2] = lcp_new2 * beta2 + lpp_new_k[k2]
-                assert 0<=k1==k2-1<self.n_temp-1, (k1,k2)
-                assert shape(ex_accept_k)==(self.n_temp-1,), (ex_accept_k, shape(ex_accept_k), self.n_dim)
-                assert ex_accept_k[k1] == 0
-                ex_accept_k[k1] = 1
-        assert shape(param_new_j_k)==(self.n_temp, self.n_dim), param_new_j_k
-        assert shape(lcp_new_k)==shape(lpp_new_k)==shape(ll_new_k)==(self.n_temp,),lcp_new_k
+        beta_l_c = np.asarray(self.beta_k, dtype=np.float64).reshape(self.n_chain, self.n_beta)
+        try_l_c = np.zeros((self.n_chain, self.n_beta - 1), dtype=np.int64)
+        accept_l_c = np.zeros((self.n_chain, self.n_beta - 1), dtype=np.int64)
+        for i in range(self.swap_sweeps):
+            self.swap_sweep(beta_l_c, self.exchange_count * self.swap_sweeps + i, try_l_c, accept_l_c)
+        # no exchange between the last replica of a chain and the first of the next
+        ex_accept_k = np.concatenate([
+            np.minimum(accept_l_c, 1), np.full((self.n_chain, 1), -1)
+        ], axis=1).ravel()[:-1]
         # store data
-        for k,_ in enumerate(self.beta_k):
-            self.sample_j_n_k[k] += [param_new_j_k[k]]
-            self.lcp_sample_n_k[k] += [lcp_new_k[k]]
-            self.lpp_sample_n_k[k] += [lpp_new_k[k]]
-            self.ll_sample_n_k[k] += [ll_new_k[k]]
-            self.accept_j_n_k[k] += [[-1] * self.n_dim]
-            if k < self.n_temp - 1:
-                self.exchange_accept_n_k[k] += [ex_accept_k[k]]
+        n = self.buffer.extend(1)
+        self.buffer.sample_j_n_k[:, n] = self.param_j_w[self.walker_k]
+        self.buffer.lcp_sample_n_k[:, n] = self.lcp_w[self.walker_k]
+        self.buffer.lpp_sample_n_k[:, n] = self.lpp_w[self.walker_k]
+        self.buffer.ll_sample_n_k[:, n] = self.ll_w[self.walker_k]
+        self.buffer.accept_j_n_k[:, n] = -1
+        self.buffer.exchange_accept_n_k[:, n] = ex_accept_k
+        self.buffer.walker_n_k[:, n] = self.walker_k
+        self.stats.count_exchange(
+            np.concatenate([try_l_c, np.zeros((self.n_chain, 1), dtype=np.int64)], axis=1).ravel()[:-1],
+            np.concatenate([accept_l_c, np.zeros((self.n_chain, 1), dtype=np.int64)], axis=1).ravel()[:-1],
+            self.walker_k)
         self.loop_count += 1
         self.exchange_count += 1
 
-    def suggestion(self, param_j_pre, eps_j, j_index):
+    def swap_sweep(self, beta_l_c, sweep, try_l_c, accept_l_c):
+        """
+        one pass of swaps over disjoint pairs of walkers in each chain, tested at once
+
+        Pairs by `exchange_scheme`: "deo" the neighbouring pairs of one parity
+        (even or odd index of the pair), alternated in every pass (deterministic even-odd,
+        non-reversible, so that a walker crosses the ladder in O(K) exchanges
+        instead of O(K^2)), "seo" the same with the parity drawn at random in each chain
+        (stochastic even-odd), "random" a random pairing of all betas of each chain,
+        not only neighbours.
+        Test by `swap_rule`: "metropolis" accepts with min(1, r), "gibbs" swaps with
+        r / (1 + r) (heat bath), which samples the permutation of the pair from its
+        conditional distribution; many passes of it approach the infinite swapping limit,
+        in which the permutation of all walkers is drawn from that of the current states.
+
+        Parameters
+        ----------
+        beta_l_c: np.ndarray (C, K)
+            betas of each chain
+        sweep: int
+            index of the pass, whose parity is used by "deo"
+        try_l_c, accept_l_c: np.ndarray (C, K-1)
+            numbers of tries and swaps of each neighbouring pair, added in place
+        """
+        n_chain, n_beta = beta_l_c.shape
+        walker_l_c = self.walker_k.reshape(n_chain, n_beta)
+        lcp_l_c = self.lcp_w[walker_l_c]
+        # pairs of betas (l1, l2) of each chain, whether tried, and their uniform variates
+        if self.exchange_scheme == "random":
+            level_l_c = np.array([rng.permutation(n_beta) for rng in self.rng_c])
+            l1_p_c = level_l_c[:, 0:n_beta // 2 * 2:2]
+            l2_p_c = level_l_c[:, 1:n_beta // 2 * 2:2]
+            try_p_c = True
+            lcp1_p_c = np.take_along_axis(lcp_l_c, l1_p_c, axis=1)
+            lcp2_p_c = np.take_along_axis(lcp_l_c, l2_p_c, axis=1)
+            beta1_p_c = np.take_along_axis(beta_l_c, l1_p_c, axis=1)
+            beta2_p_c = np.take_along_axis(beta_l_c, l2_p_c, axis=1)
+        else:
+            if self.exchange_scheme == "seo":
+                parity_c = np.array([rng.integers(2) for rng in self.rng_c])
+            else:
+                parity_c = np.full(n_chain, sweep % 2)
+            l1_p_c = np.arange(n_beta - 1)[np.newaxis, :]
+            l2_p_c = l1_p_c + 1
+            try_p_c = l1_p_c % 2 == parity_c[:, np.newaxis]
+            lcp1_p_c, lcp2_p_c = lcp_l_c[:, :-1], lcp_l_c[:, 1:]
+            beta1_p_c, beta2_p_c = beta_l_c[:, :-1], beta_l_c[:, 1:]
+        with np.errstate(divide="ignore"):
+            log_u_p_c = np.log([rng.random(lcp1_p_c.shape[1]) for rng in self.rng_c])
+        ll_pre_p_c = lcp1_p_c * beta1_p_c + lcp2_p_c * beta2_p_c
+        ll_new_p_c = lcp2_p_c * beta1_p_c + lcp1_p_c * beta2_p_c
+        accept_p_c = self.swap_test(ll_pre_p_c, ll_new_p_c, log_u_p_c) & try_p_c
+        # swap walkers of the accepted pairs, which are disjoint
+        c_p, p = np.nonzero(accept_p_c)
+        k1 = c_p * n_beta + np.broadcast_to(l1_p_c, accept_p_c.shape)[c_p, p]
+        k2 = c_p * n_beta + np.broadcast_to(l2_p_c, accept_p_c.shape)[c_p, p]
+        k_swap = np.concatenate([k1, k2])
+        self.walker_k[k_swap] = self.walker_k[np.concatenate([k2, k1])]
+        w_swap = self.walker_k[k_swap]
+        self.ll_w[w_swap] = self.lcp_w[w_swap] * beta_l_c.ravel()[k_swap] + self.lpp_w[w_swap]
+        # counts of the neighbouring pairs
+        if self.exchange_scheme != "random":
+            try_l_c += try_p_c
+            accept_l_c += accept_p_c
+            return
+        c_p_c = np.broadcast_to(np.arange(n_chain)[:, np.newaxis], l1_p_c.shape)
+        neighbour_p_c = np.abs(l2_p_c - l1_p_c) == 1
+        lower_p_c = np.minimum(l1_p_c, l2_p_c)
+        try_l_c[c_p_c[neighbour_p_c], lower_p_c[neighbour_p_c]] += 1
+        accept_l_c[c_p_c[accept_p_c & neighbour_p_c], lower_p_c[accept_p_c & neighbour_p_c]] += 1
+
+    def swap_test(self, ll_pre, ll_new, log_u):
+        """
+        whether swaps are accepted by `swap_rule`, elementwise
+
+        Parameters
+        ----------
+        ll_pre, ll_new: np.ndarray | float
+            sums of the tempered log conditional probabilities of the pairs before and after swap
+        log_u: np.ndarray | float
+            log of uniform variates
+
+        Returns
+        -------
+        np.ndarray[bool] | bool
+        """
+        with np.errstate(invalid="ignore"):
+            if self.swap_rule == "gibbs":
+                return log_u < ll_new - np.logaddexp(ll_pre, ll_new)
+            return (ll_new >= ll_pre) | (log_u < ll_new - ll_pre)
+
+    def suggestion(self, param_j_pre, step_j, j_index):
         """
         suggest a new sample
 
@@ -346,23 +1567,23 @@ class ReplicaExchangeBase(object):
         ----------
         param_j_pre: list[(float|int)] (N_dim,)
             previous param sample
-        eps_j: list[(float|int)] (N_dim,)
-            step width
-        j_index: int
-            Index of the parameter to be changed
+        step_j: list[float] (N_dim,)
+            gaussian steps drawn in advance, of the width `eps_j`
+        j_index: list[int]
+            Indices of the parameters to be changed
 
         Returns
         -------
         param_j_new: list[(float|int)] (N_dim,)
             suggested param sample
         """
-        param_j_new = self._suggestion(param_j_pre, eps_j, j_index)
+        param_j_new = self._suggestion(param_j_pre, step_j, j_index)
         assert shape(param_j_new)==(self.n_dim,), (param_j_new, len(param_j_new[0]), len(self.sample_j_n_k[0]))
         return param_j_new
 
     @staticmethod #@njit
     @abstractmethod
-    def _suggestion(param_j_pre, eps_j, j_index):
+    def _suggestion(param_j_pre, step_j, j_index):
         """
         suggest a new sample
 
@@ -370,10 +1591,10 @@ class ReplicaExchangeBase(object):
         ----------
         param_j_pre: list[(float|int)] (N_dim,)
             previous param sample
-        eps_j: list[(float|int)] (N_dim,)
-            step width
-        j_index: int
-            Index of the parameter to be changed
+        step_j: list[float] (N_dim,)
+            gaussian steps drawn in advance, of the width `eps_j`
+        j_index: list[int]
+            Indices of the parameters to be changed
 
         Returns
         -------
@@ -381,13 +1602,116 @@ class ReplicaExchangeBase(object):
             suggested param sample
         """
         param_j_new = [param for param in param_j_pre]
-        param_j_new[j_index] += np.random.normal(0, eps_j[j_index])
+        for j in j_index:
+            param_j_new[j] += step_j[j]
         return param_j_new
 
+    def log_condprob_batch(self, param_j_k) -> np.ndarray:
+        """
+        calc log likelihood of all replicas
+
+        Parameters
+        ----------
+        param_j_k: np.ndarray (K, J)
+            params of each replica
+
+        Returns
+        -------
+        np.ndarray (K,)
+            log conditional probability of each replica
+        """
+        if self.batch_log_condprob is not None:
+            return self.batch_log_condprob(param_j_k)
+        return np.array([self.log_condprob(param_j) for param_j in param_j_k])
+
+    def log_priorprob_batch(self, param_j_k) -> np.ndarray:
+        """
+        calc log prior probability of all replicas
+
+        Parameters
+        ----------
+        param_j_k: np.ndarray (K, J)
+            params of each replica
+
+        Returns
+        -------
+        np.ndarray (K,)
+            log prior probability of each replica
+        """
+        return np.array([self.log_priorprob(param_j) for param_j in param_j_k])
+
+    def log_condprob_term(self, param_j, j) -> float:
+        """
+        calc j-th term of log likelihood for separable model
+
+        The term must depend only on `param_j[j]`, and the sum of all terms
+        must equal `log_condprob(param_j)`.
+
+        Parameters
+        ----------
+        param_j: list[(float|int)] (N_dim,)
+            param sample
+        j: int
+            index of the term
+
+        Returns
+        -------
+        float
+            j-th term of log conditional probability
+        """
+        raise NotImplementedError(
+            f"{type(self).__name__} is not separable"
+        )
+
+    def log_priorprob_term(self, param_j, j) -> float:
+        """
+        calc j-th term of log prior probability for separable model,
+        see `log_condprob_term`
+        """
+        raise NotImplementedError(
+            f"{type(self).__name__} is not separable"
+        )
+
+    def compiled_model(self):
+        """
+        njit functions of the model for compiled engines
+
+        Returns
+        -------
+        log_condprob: njit function
+            called as `log_condprob(param_j, *condprob_args)` with f8[:] `param_j`
+        condprob_args: tuple
+        log_priorprob: njit function
+            called as `log_priorprob(param_j, *priorprob_args)` with f8[:] `param_j`
+        priorprob_args: tuple
+        """
+        raise NotImplementedError(
+            f"{type(self).__name__} does not provide njit model for engine '{self.engine}'"
+        )
+
+    def compiled_model_term(self):
+        """
+        njit per-parameter terms of separable model for compiled engines
+
+        Returns
+        -------
+        log_condprob_term: njit function
+            called as `log_condprob_term(param_j[j], j, *condprob_args)`
+        condprob_args: tuple
+        log_priorprob_term: njit function
+            called as `log_priorprob_term(param_j[j], j, *priorprob_args)`
+        priorprob_args: tuple
+        """
+        raise NotImplementedError(
+            f"{type(self).__name__} does not provide njit terms for engine '{self.engine}'"
+        )
+
     def log_condprob(self, param_j) -> float:
         """
         calc log likelihood, passing params to staticmethod
         """
+        if self.factorized:
+            return self.condprob_factors.evaluate(param_j).sum()
         return self._log_condprob(*[f8(p) for p in param_j])
 
     @staticmethod #@njit
@@ -412,6 +1736,8 @@ class ReplicaExchangeBase(object):
         """
         calc log prior probability, passing params to staticmethod
         """
+        if self.factorized:
+            return self.priorprob_factors.evaluate(param_j).sum()
         return self._log_priorprob(*[f8(p) for p in param_j])
 
     @staticmethod #@njit
@@ -432,8 +1758,27 @@ class ReplicaExchangeBase(object):
         """
         pass
     
+    def snapshot(self):
+        """
+        running statistics of the sampler, without scanning the history
+
+        See `OnlineStats.snapshot`, with `loop_count` and `exchange_count` added.
+
+        Returns
+        -------
+        dict
+        """
+        return {
+            "loop_count": self.loop_count,
+            "exchange_count": self.exchange_count,
+            **self.stats.snapshot(),
+        }
+
     def verbose(self):
         """verbose status"""
+        snapshot = self.snapshot()
+        param_j_k = self.param_j_k
+        ll_k = self.ll_k
         print(
             self.loop_count,
             self.exchange_count,
@@ -441,13 +1786,37 @@ class ReplicaExchangeBase(object):
         for j,pn in enumerate(self.param_name_j):
             print(
                 f"   {pn.ljust(8)}"\
-                f"{', '.join(['%.3f' % (self.sample_j_n_k[k][-1][j]) for k,_ in enumerate(self.beta_k)])}")
+                f"{', '.join(['%.3f' % (param_j_k[k][j]) for k,_ in enumerate(self.beta_k)])}")
         print(
             f"   {'ll'.ljust(8)}"\
-            f"{', '.join(['%.3f' % (self.ll_sample_n_k[k][-1]) for k,_ in enumerate(self.beta_k)])}")
-    
+            f"{', '.join(['%.3f' % (ll_k[k]) for k,_ in enumerate(self.beta_k)])}")
+        print(
+            f"   {'accept'.ljust(8)}"\
+            f"{', '.join(['%.3f' % rate for rate in snapshot['accept_rate_j_k'].mean(axis=1)])}")
+        if self.n_beta > 1:
+            print(
+                f"   {'swap'.ljust(8)}"\
+                f"{', '.join(['%.3f' % rate for rate in snapshot['swap_rate_k']])}")
+            print(
+                f"   {'trips'.ljust(8)}"\
+                f"{', '.join(['%d' % trip for trip in snapshot['round_trip_c']])}")
+
     def save(self, name:str, timestamp=False):
-        """save data"""
+        """
+        save data as a run file, see `runfile.load_run` to read it
+
+        Parameters
+        ----------
+        name: str
+            file name
+        timestamp: bool, default=False
+            add timestamp to the file name (also added if the file exists)
+
+        Returns
+        -------
+        str
+            name of the saved file
+        """
         name = os.path.abspath(name)
         try:
             os.makedirs(os.path.dirname(name))
@@ -459,19 +1828,24 @@ class ReplicaExchangeBase(object):
             name = root\
                 + "_" + datetime.datetime.now().strftime("%y%m%d-%H%M%S-%f")\
                 + ext
-        with open(name, mode='wb') as f:
-            pickle.dump({
-                "param_name_j": self.param_name_j,
-                "beta_k": self.beta_k,
-                "eps_j_k": self.eps_j_k,
-                "exchange_step": self.exchange_step,
-                "accept_j_n_k": self.accept_j_n_k,
-                "exchange_accept_n_k": self.exchange_accept_n_k,
-                "sample_j_n_k": self.sample_j_n_k,
-                "lcp_sample_n_k": self.lcp_sample_n_k,
-                "lpp_sample_n_k": self.lpp_sample_n_k,
-                "ll_sample_n_k": self.ll_sample_n_k
-            }, f)
+        write_run(name, {
+            "param_name_j": list(self.param_name_j),
+            "beta_k": np.asarray(self.beta_k, dtype=np.float64).tolist(),
+            "eps_j_k": np.asarray(self.eps_j_k, dtype=np.float64).tolist(),
+            "exchange_step": self.exchange_step,
+            "n_chain": self.n_chain,
+            "record_k": self.record_k.tolist(),
+            "n_tune": self.n_tune,
+        }, {
+            "accept_j_n_k": self.accept_j_n_k,
+            "exchange_accept_n_k": self.exchange_accept_n_k,
+            "sample_j_n_k": self.sample_j_n_k,
+            "lcp_sample_n_k": self.lcp_sample_n_k,
+            "lpp_sample_n_k": self.lpp_sample_n_k,
+            "ll_sample_n_k": self.ll_sample_n_k,
+            "walker_n_k": self.walker_n_k
+        })
+        return name
 
 
 class VectorSampling(ReplicaExchangeBase):
@@ -485,18 +1859,33 @@ class VectorSampling(ReplicaExchangeBase):
         prior_center,
         prior_width,
         init,
-        *params, **kwargs
+        *params,
+        batch_log_likelifood_function=None,
+        log_likelifood_term=None,
+        **kwargs
     ):
         param_name_j = [f"x_{i}" for i in range(dimention)]
         self.target_function = log_likelifood_function
+        self.target_term = log_likelifood_term
+        self.separable = log_likelifood_term is not None
         static_params = {
             "prior_center": f8(prior_center),
             "prior_width": f8(prior_width)
         }
-        param_init_j_k = [
-            [init[k][pn] for _j,pn in enumerate(param_name_j)]
-            for k,_ in enumerate(beta_k)
-        ]
+        if isinstance(init[0], dict):
+            param_init_j_k = [
+                [init[k][pn] for _j,pn in enumerate(param_name_j)]
+                for k,_ in enumerate(beta_k)
+            ]
+        else:
+            # init of each chain
+            param_init_j_k = [
+                [
+                    [init_k[k][pn] for _j,pn in enumerate(param_name_j)]
+                    for k,_ in enumerate(beta_k)
+                ]
+                for init_k in init
+            ]
 
         super().__init__(
             param_name_j=param_name_j,
@@ -506,6 +1895,7 @@ class VectorSampling(ReplicaExchangeBase):
             param_init_j_k=param_init_j_k,
             data=dict(),
             static_params=static_params,
+            batch_log_condprob=batch_log_likelifood_function,
             *params, **kwargs
         )
 
@@ -526,10 +1916,69 @@ class VectorSampling(ReplicaExchangeBase):
         """
         return sum(-(param_j - prior_mid)**2/2/prior_width**2)
 
+    def log_priorprob_batch(self, param_j_k) -> np.ndarray:
+        """prior probability of all replicas"""
+        return self._log_priorprob_batch(
+            param_j_k,
+            self.static_params["prior_center"],
+            self.static_params["prior_width"]
+        )
+
+    @staticmethod
+    @njit("f8[:](f8[:, :], f8[:], f8[:])")
+    def _log_priorprob_batch(param_j_k, prior_mid, prior_width) -> np.ndarray:
+        """
+        calc log prior probability of all replicas
+        """
+        lpp_k = np.empty(param_j_k.shape[0])
+        for k in range(param_j_k.shape[0]):
+            lpp_k[k] = np.sum(-(param_j_k[k] - prior_mid)**2/2/prior_width**2)
+        return lpp_k
+
+    def log_priorprob_term(self, param_j, j) -> float:
+        """j-th term of prior probability"""
+        return self._log_priorprob_term(
+            f8(param_j[j]), j,
+            self.static_params["prior_center"],
+            self.static_params["prior_width"]
+        )
+
+    @staticmethod
+    @njit("f8(f8, i8, f8[:], f8[:])")
+    def _log_priorprob_term(param, j, prior_mid, prior_width) -> float:
+        """
+        calc j-th term of log prior probability
+        """
+        return -(param - prior_mid[j])**2/2/prior_width[j]**2
+
     def log_condprob(self, param_j) -> float:
         """prior probability"""
         return self.target_function(f8(param_j))
 
+    def log_condprob_term(self, param_j, j) -> float:
+        """j-th term of target function"""
+        return self.target_term(f8(param_j[j]), j)
+
+    def compiled_model(self):
+        """njit target function and prior probability"""
+        return (
+            self.target_function, (),
+            self._log_priorprob, (
+                self.static_params["prior_center"],
+                self.static_params["prior_width"]
+            )
+        )
+
+    def compiled_model_term(self):
+        """njit terms of target function and prior probability"""
+        return (
+            self.target_term, (),
+            self._log_priorprob_term, (
+                self.static_params["prior_center"],
+                self.static_params["prior_width"]
+            )
+        )
+
 
 if __name__=="__main__":
     from utils import target_function
@@ -0,0 +1,104 @@
+import numpy as np
+
+
+class RunningMoments(object):
+    """
+    streaming mean, variance and covariance of the parameters of each replica
+
+    Rows are collected in blocks of `block_size`, and each block is merged into
+    the running moments by the pairwise update of Chan et al., which is as stable
+    as the one-by-one update of Welford, with a few array operations per block.
+    Memory does not depend on the number of rows.
+    """
+    def __init__(self, n_temp, n_dim, block_size=256):
+        """
+        Parameters
+        ----------
+        n_temp: int
+            number of replicas
+        n_dim: int
+            number of parameters
+        block_size: int, default=256
+            number of rows merged at once
+        """
+        if block_size < 1:
+            raise ValueError(
+                f"block_size must be positive but this is {block_size}"
+            )
+        self._n_sample = 0
+        self._mean_j_k = np.zeros((n_temp, n_dim))
+        self._m2_j_j_k = np.zeros((n_temp, n_dim, n_dim))
+        self._block_j_n_k = np.empty((n_temp, block_size, n_dim))
+        self._n_block = 0
+
+    def update(self, sample_j_n_k):
+        """
+        add rows
+
+        Parameters
+        ----------
+        sample_j_n_k: np.ndarray (K, N, J)
+            samples of each replica
+        """
+        block_size = self._block_j_n_k.shape[1]
+        n_rows = sample_j_n_k.shape[1]
+        n = 0
+        while n < n_rows:
+            m = min(n_rows - n, block_size - self._n_block)
+            self._block_j_n_k[:, self._n_block:self._n_block + m] = sample_j_n_k[:, n:n + m]
+            self._n_block += m
+            n += m
+            if self._n_block == block_size:
+                self.merge()
+
+    def merge(self):
+        """merge the collected rows into the running moments"""
+        if self._n_block == 0:
+            return
+        block_j_n_k = self._block_j_n_k[:, :self._n_block]
+        n_block = self._n_block
+        n_sample = self._n_sample + n_block
+        mean_j_k = block_j_n_k.mean(axis=1)
+        dev_j_n_k = block_j_n_k - mean_j_k[:, np.newaxis]
+        delta_j_k = mean_j_k - self._mean_j_k
+        self._mean_j_k += delta_j_k * (n_block / n_sample)
+        self._m2_j_j_k += np.einsum("kni,knj->kij", dev_j_n_k, dev_j_n_k)\
+            + np.einsum("ki,kj->kij", delta_j_k, delta_j_k) * (self._n_sample * n_block / n_sample)
+        self._n_sample = n_sample
+        self._n_block = 0
+
+    @property
+    def n_sample(self):
+        """number of rows added"""
+        return self._n_sample + self._n_block
+
+    @property
+    def mean_j_k(self):
+        """(K, J) mean"""
+        self.merge()
+        return self._mean_j_k.copy()
+
+    @property
+    def cov_j_j_k(self):
+        """(K, J, J) unbiased covariance"""
+        self.merge()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return self._m2_j_j_k / (self._n_sample - 1)
+
+    @property
+    def var_j_k(self):
+        """(K, J) unbiased variance"""
+        return np.diagonal(self.cov_j_j_k, axis1=1, axis2=2).copy()
+
+    @property
+    def std_j_k(self):
+        """(K, J) standard deviation"""
+        return np.sqrt(self.var_j_k)
+
+    @property
+    def corr_j_j_k(self):
+        """(K, J, J) correlation"""
+        cov_j_j_k = self.cov_j_j_k
+        std_j_k = np.sqrt(np.diagonal(cov_j_j_k, axis1=1, axis2=2))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return cov_j_j_k / std_j_k[:, :, np.newaxis] / std_j_k[:, np.newaxis, :]
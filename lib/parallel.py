@@ -0,0 +1,341 @@
+import multiprocessing
+import multiprocessing.connection
+import time
+from collections import deque
+from multiprocessing import shared_memory
+import numpy as np
+import numba.np.ufunc.parallel as numba_parallel
+
+from engine import draw_steps, random_rows
+
+
+def _start_method():
+    """
+    start method of the workers: fork, unless the threads of numba `parallel=True`
+    (e.g. `sweep_factor_colour`) have started, which a forked child inherits
+    without their state and hangs at exit; then a fresh process by forkserver or spawn
+    """
+    methods = multiprocessing.get_all_start_methods()
+    if "fork" in methods and not numba_parallel._is_initialized:
+        return "fork"
+    return "forkserver" if "forkserver" in methods else "spawn"
+
+
+class SharedArray(object):
+    """numpy array on `multiprocessing.shared_memory`"""
+    def __init__(self, shape, dtype, name=None):
+        """
+        Parameters
+        ----------
+        shape: tuple[int]
+        dtype: np.dtype
+        name: str, optional
+            name of existing shared memory to attach, create new one if None
+        """
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        size = max(int(np.prod(self.shape)) * self.dtype.itemsize, 1)
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.array = np.ndarray(self.shape, dtype=self.dtype, buffer=self.shm.buf)
+
+    def __reduce__(self):
+        return (type(self), (self.shape, self.dtype, self.shm.name))
+
+    def close(self, unlink=False):
+        """release shared memory"""
+        del self.array
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def _worker(sampler, shared, conn):
+    """
+    worker process: M-H steps of the assigned replicas on request
+
+    Parameters
+    ----------
+    sampler: ReplicaExchangeBase
+        copy of the sampler, only its model is used
+    shared: dict[str, SharedArray]
+        current states and history buffers
+    conn: multiprocessing.connection.Connection
+        pipe to the master
+    """
+    a = {key: value.array for key, value in shared.items()}
+    while True:
+        message = conn.recv()
+        if message[0] == "stop":
+            break
+        _, batch, k_list, rng_state_k, beta_k, eps_j_k, walker_k = message
+        sampler.beta_k = beta_k
+        sampler.eps_j_k = eps_j_k
+        time_k = []
+        for k, rng_state in zip(k_list, rng_state_k):
+            start = time.perf_counter()
+            rng = sampler.rng_k[k]
+            rng.bit_generator.state = rng_state
+            w = walker_k[k]
+            param_j_s, lcp_s, lpp_s, ll_s, accept_j_s = sampler.get_batch(
+                a["param_j_w"][w].tolist(),
+                a["lcp_w"][w], a["lpp_w"][w], a["ll_w"][w],
+                beta_k[k], eps_j_k[k], batch, rng,
+                *((a["lcp_term_t_w"][w], a["lpp_term_t_w"][w]) if sampler.cached_terms else ())
+            )
+            a["sample_j_n_k"][k, :batch] = param_j_s
+            a["lcp_sample_n_k"][k, :batch] = lcp_s
+            a["lpp_sample_n_k"][k, :batch] = lpp_s
+            a["ll_sample_n_k"][k, :batch] = ll_s
+            a["accept_j_n_k"][k, :batch] = accept_j_s
+            a["param_j_w"][w] = param_j_s[-1]
+            a["lcp_w"][w] = lcp_s[-1]
+            a["lpp_w"][w] = lpp_s[-1]
+            a["ll_w"][w] = ll_s[-1]
+            time_k.append(time.perf_counter() - start)
+        conn.send((time_k, [sampler.rng_k[k].bit_generator.state for k in k_list]))
+    del a
+    for value in shared.values():
+        value.close()
+    conn.close()
+
+
+class ReplicaProcessPool(object):
+    """
+    worker processes to run M-H steps of replica exchange in parallel
+
+    Each worker runs the python path of the sampler for the replicas assigned to it.
+    Only the current states and the log probabilities are exchanged through
+    shared memory, and each batch of history is written to shared buffers
+    which the master copies to its own. The states of the random number generators
+    are sent with each request and returned with the result.
+    The exchange step itself is done by the master.
+
+    `run` updates all replicas and waits for them. For `ReplicaExchangeBase.update_async`,
+    `submit` queues the steps of a single replica, which run on the first idle worker,
+    and `wait` returns the replicas finished.
+
+    Every replica has its own random number generator, which moves with it between workers,
+    so the result does not depend on the number of workers or the assignment.
+    With fewer workers than replicas, replicas are assigned by their measured cost
+    (longest processing time first) to balance the load.
+    """
+    def __init__(self, sampler, n_workers, batch_size):
+        """
+        Parameters
+        ----------
+        sampler: ReplicaExchangeBase
+            sampler to run
+        n_workers: int
+            number of worker processes
+        batch_size: int
+            maximum number of continuus calculation
+        """
+        self.n_temp = sampler.n_temp
+        self.n_workers = min(n_workers, self.n_temp)
+        self.batch_size = batch_size
+        self.cached_terms = sampler.cached_terms
+        n_temp, n_dim = sampler.n_temp, sampler.n_dim
+        shapes = {
+            "param_j_w": ((n_temp, n_dim), np.float64),
+            "lcp_w": ((n_temp,), np.float64),
+            "lpp_w": ((n_temp,), np.float64),
+            "ll_w": ((n_temp,), np.float64),
+            "sample_j_n_k": ((n_temp, batch_size, n_dim), np.float64),
+            "lcp_sample_n_k": ((n_temp, batch_size), np.float64),
+            "lpp_sample_n_k": ((n_temp, batch_size), np.float64),
+            "ll_sample_n_k": ((n_temp, batch_size), np.float64),
+            "accept_j_n_k": ((n_temp, batch_size, n_dim), np.int8),
+        }
+        if self.cached_terms:
+            shapes["lcp_term_t_w"] = (sampler.lcp_term_t_w.shape, np.float64)
+            shapes["lpp_term_t_w"] = (sampler.lpp_term_t_w.shape, np.float64)
+        self.shared = {
+            key: SharedArray(shape, dtype) for key, (shape, dtype) in shapes.items()
+        }
+        self.a = {key: value.array for key, value in self.shared.items()}
+        self.cost_k = np.ones(n_temp)
+
+        # workers get the model by fork where available, by pickle otherwise;
+        # the random number helpers are compiled before fork, not in each worker
+        random_rows(n_dim, len(sampler.block_b))
+        draw_steps(np.random.default_rng(0), np.ones(n_dim), len(sampler.block_b), 1)
+        context = multiprocessing.get_context(_start_method())
+        executor, sampler.executor = sampler.executor, None
+        self.conns = []
+        self.processes = []
+        try:
+            for _ in range(self.n_workers):
+                conn, child_conn = context.Pipe()
+                process = context.Process(
+                    target=_worker, args=(sampler, self.shared, child_conn), daemon=True)
+                process.start()
+                child_conn.close()
+                self.conns.append(conn)
+                self.processes.append(process)
+        finally:
+            sampler.executor = executor
+        # asynchronous requests: waiting (replica, row, batch), idle workers and running ones
+        self.queue = deque()
+        self.idle = list(self.conns)
+        self.running = {}
+
+    def assign(self):
+        """
+        assign replicas to workers, most expensive first to the least loaded worker
+
+        Returns
+        -------
+        list[list[int]]
+            indices of the replicas of each worker
+        """
+        load_w = np.zeros(self.n_workers)
+        k_list_w = [[] for _ in range(self.n_workers)]
+        for k in np.argsort(-self.cost_k, kind="stable"):
+            w = int(np.argmin(load_w))
+            k_list_w[w].append(int(k))
+            load_w[w] += self.cost_k[k]
+        return [sorted(k_list) for k_list in k_list_w]
+
+    def run(self, sampler, batch):
+        """
+        run `batch` M-H steps of all replicas and copy the results to the sampler
+
+        Parameters
+        ----------
+        sampler: ReplicaExchangeBase
+            sampler holding the current state and the buffer to write
+        batch: int
+            number of continuus calculation
+
+        Returns
+        -------
+        int
+            index of the first written row of the buffer
+        """
+        a = self.a
+        a["param_j_w"][:] = sampler.param_j_w
+        a["lcp_w"][:] = sampler.lcp_w
+        a["lpp_w"][:] = sampler.lpp_w
+        a["ll_w"][:] = sampler.ll_w
+        if self.cached_terms:
+            a["lcp_term_t_w"][:] = sampler.lcp_term_t_w
+            a["lpp_term_t_w"][:] = sampler.lpp_term_t_w
+        beta_k = list(sampler.beta_k)
+        eps_j_k = [list(eps_j) for eps_j in sampler.eps_j_k]
+        k_list_w = self.assign()
+        for conn, k_list in zip(self.conns, k_list_w):
+            conn.send((
+                "run", batch, k_list,
+                [sampler.rng_k[k].bit_generator.state for k in k_list],
+                beta_k, eps_j_k, sampler.walker_k))
+        for conn, k_list in zip(self.conns, k_list_w):
+            time_k, rng_state_k = conn.recv()
+            for k, t, rng_state in zip(k_list, time_k, rng_state_k):
+                # moving average of the cost of each replica
+                self.cost_k[k] = 0.8 * self.cost_k[k] + 0.2 * t
+                sampler.rng_k[k].bit_generator.state = rng_state
+        sampler.param_j_w[:] = a["param_j_w"]
+        sampler.lcp_w[:] = a["lcp_w"]
+        sampler.lpp_w[:] = a["lpp_w"]
+        sampler.ll_w[:] = a["ll_w"]
+        if self.cached_terms:
+            sampler.lcp_term_t_w[:] = a["lcp_term_t_w"]
+            sampler.lpp_term_t_w[:] = a["lpp_term_t_w"]
+        n = sampler.buffer.extend(batch)
+        sampler.buffer.sample_j_n_k[:, n:n+batch] = a["sample_j_n_k"][:, :batch]
+        sampler.buffer.lcp_sample_n_k[:, n:n+batch] = a["lcp_sample_n_k"][:, :batch]
+        sampler.buffer.lpp_sample_n_k[:, n:n+batch] = a["lpp_sample_n_k"][:, :batch]
+        sampler.buffer.ll_sample_n_k[:, n:n+batch] = a["ll_sample_n_k"][:, :batch]
+        sampler.buffer.accept_j_n_k[:, n:n+batch] = a["accept_j_n_k"][:, :batch]
+        return n
+
+    def submit(self, sampler, k, n, batch):
+        """
+        queue `batch` M-H steps of k-th replica, to be written from n-th row of the buffer
+
+        Parameters
+        ----------
+        sampler: ReplicaExchangeBase
+            sampler holding the current state and the buffer to write
+        k: int
+            index of the replica
+        n: int
+            first row of the buffer to write
+        batch: int
+            number of continuus calculation
+        """
+        self.queue.append((k, n, batch))
+        self.dispatch(sampler)
+
+    def dispatch(self, sampler):
+        """send the queued requests to idle workers, with the current state of the walkers"""
+        a = self.a
+        while self.queue and self.idle:
+            k, n, batch = self.queue.popleft()
+            conn = self.idle.pop()
+            w = sampler.walker_k[k]
+            a["param_j_w"][w] = sampler.param_j_w[w]
+            a["lcp_w"][w] = sampler.lcp_w[w]
+            a["lpp_w"][w] = sampler.lpp_w[w]
+            a["ll_w"][w] = sampler.ll_w[w]
+            if self.cached_terms:
+                a["lcp_term_t_w"][w] = sampler.lcp_term_t_w[w]
+                a["lpp_term_t_w"][w] = sampler.lpp_term_t_w[w]
+            conn.send((
+                "run", batch, [k], [sampler.rng_k[k].bit_generator.state],
+                list(sampler.beta_k), [list(eps_j) for eps_j in sampler.eps_j_k],
+                sampler.walker_k))
+            self.running[conn] = (k, n, batch)
+
+    def wait(self, sampler):
+        """
+        wait for at least one request of `submit` and copy the results to the sampler
+
+        Parameters
+        ----------
+        sampler: ReplicaExchangeBase
+
+        Returns
+        -------
+        list[int]
+            indices of the replicas finished
+        """
+        a = self.a
+        finished = []
+        for conn in multiprocessing.connection.wait(list(self.running)):
+            k, n, batch = self.running.pop(conn)
+            (t,), (rng_state,) = conn.recv()
+            self.cost_k[k] = 0.8 * self.cost_k[k] + 0.2 * t
+            sampler.rng_k[k].bit_generator.state = rng_state
+            # the walker of the replica is not exchanged while its steps run
+            w = sampler.walker_k[k]
+            sampler.param_j_w[w] = a["param_j_w"][w]
+            sampler.lcp_w[w] = a["lcp_w"][w]
+            sampler.lpp_w[w] = a["lpp_w"][w]
+            sampler.ll_w[w] = a["ll_w"][w]
+            if self.cached_terms:
+                sampler.lcp_term_t_w[w] = a["lcp_term_t_w"][w]
+                sampler.lpp_term_t_w[w] = a["lpp_term_t_w"][w]
+            sampler.buffer.sample_j_n_k[k, n:n+batch] = a["sample_j_n_k"][k, :batch]
+            sampler.buffer.lcp_sample_n_k[k, n:n+batch] = a["lcp_sample_n_k"][k, :batch]
+            sampler.buffer.lpp_sample_n_k[k, n:n+batch] = a["lpp_sample_n_k"][k, :batch]
+            sampler.buffer.ll_sample_n_k[k, n:n+batch] = a["ll_sample_n_k"][k, :batch]
+            sampler.buffer.accept_j_n_k[k, n:n+batch] = a["accept_j_n_k"][k, :batch]
+            self.idle.append(conn)
+            finished.append(k)
+        self.dispatch(sampler)
+        return finished
+
+    def close(self):
+        """stop workers and release shared memory"""
+        for conn in self.conns:
+            conn.send(("stop",))
+            conn.close()
+        for process in self.processes:
+            process.join()
+        del self.a
+        for value in self.shared.values():
+            value.close(unlink=True)
@@ -0,0 +1,99 @@
+import json
+import os
+import pickle
+import struct
+import numpy as np
+
+from sink import HISTORY, read_chunks
+
+# file layout:
+#   header   MAGIC (8 bytes), length of metadata and offset of the first section (uint64 x 2)
+#   metadata JSON, with dtype, shape and offset (from the first section) of each array
+#   sections raw C-order arrays, each aligned to ALIGN bytes
+MAGIC = b"REMCRUN1"
+ALIGN = 64
+_HEADER = struct.Struct("<8sQQ")
+
+
+def _aligned(n):
+    return -(-n // ALIGN) * ALIGN
+
+
+def write_run(path, meta, arrays):
+    """
+    write a run file
+
+    Parameters
+    ----------
+    path: str
+        file to write
+    meta: dict
+        JSON serializable settings of the run
+    arrays: dict[str, np.ndarray]
+        arrays to write, e.g. (K, N, J) sample history
+    """
+    sections = {}
+    offset = 0
+    for name, array in arrays.items():
+        sections[name] = {
+            "dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset = _aligned(offset + array.nbytes)
+    meta_bytes = json.dumps({**meta, "arrays": sections}).encode()
+    data_start = _aligned(_HEADER.size + len(meta_bytes))
+    with open(path, mode="wb") as f:
+        f.write(_HEADER.pack(MAGIC, len(meta_bytes), data_start))
+        f.write(meta_bytes)
+        for name, array in arrays.items():
+            f.seek(data_start + sections[name]["offset"])
+            # by the first axis, not to copy the whole (non-contiguous) array at once
+            for array_k in array if array.ndim > 1 else [array]:
+                np.ascontiguousarray(array_k).tofile(f)
+        f.truncate(data_start + offset)
+
+
+def load_run(path, mode="r"):
+    """
+    load a run saved by `ReplicaExchangeBase.save`
+
+    Arrays of a run file are memmap, so that slicing e.g. `sample_j_n_k[k0, burnin::skip]`
+    reads only the pages needed.
+    Also reads legacy pickle files and the directory written by `ChunkSink`.
+
+    Parameters
+    ----------
+    path: str
+        run file, legacy pickle file or `ChunkSink` directory
+    mode: str, default="r"
+        mode of memmap
+
+    Returns
+    -------
+    dict
+        settings of the run and the sample history (`sample_j_n_k` etc.)
+    """
+    if os.path.isdir(path):
+        meta, history = read_chunks(path)
+        meta.pop("shape")
+        meta.pop("dtype")
+        return {**meta, **history}
+    with open(path, mode="rb") as f:
+        magic, meta_size, data_start = _HEADER.unpack(f.read(_HEADER.size).ljust(_HEADER.size, b"\0"))
+        if magic != MAGIC:
+            # legacy pickle
+            f.seek(0)
+            data = pickle.load(f)
+            for name in HISTORY:
+                if name in data:
+                    data[name] = np.asarray(data[name])
+            return data
+        meta = json.loads(f.read(meta_size))
+    sections = meta.pop("arrays")
+    for name, section in sections.items():
+        shape = tuple(section["shape"])
+        if 0 in shape:
+            meta[name] = np.zeros(shape, dtype=section["dtype"])
+            continue
+        meta[name] = np.memmap(
+            path, dtype=section["dtype"], mode=mode, shape=shape,
+            offset=data_start + section["offset"])
+    return meta
@@ -0,0 +1,184 @@
+import json
+import os
+import numpy as np
+
+# history written by ChunkSink, and its dtype
+HISTORY = {
+    "sample_j_n_k": np.float64,
+    "lcp_sample_n_k": np.float64,
+    "lpp_sample_n_k": np.float64,
+    "ll_sample_n_k": np.float64,
+    "accept_j_n_k": np.int8,
+    "exchange_accept_n_k": np.int8,
+    "walker_n_k": np.int16,
+}
+
+
+class ChunkSink(object):
+    """
+    append-only on-disk history, written chunk by chunk during `sampling`
+
+    The history is kept in a directory with `meta.json` and one raw file for each array.
+    Each file is in (N, K, ...) order, so that a chunk is appended at the end of the file,
+    and `read_chunks` gives (K, N, ...) memmap views of it.
+    After a crash, the rows written so far can be read.
+    """
+    def __init__(self, path, chunk_size=4096, mode="w"):
+        """
+        Parameters
+        ----------
+        path: str
+            directory to write
+        chunk_size: int, default=4096
+            number of rows kept in memory before they are written
+        mode: str, default="w"
+            "w": start a new history, removing the files of the previous one
+            "a": continue the existing history, of which the first `storage.n_discarded`
+            rows of the sampler are kept (e.g. a sampler restored by `resume`)
+        """
+        if mode not in ("w", "a"):
+            raise ValueError(
+                f"mode must be 'w' or 'a' but this is {mode}"
+            )
+        if chunk_size < 1:
+            raise ValueError(
+                f"chunk_size must be positive but this is {chunk_size}"
+            )
+        self.path = os.path.abspath(path)
+        self.chunk_size = chunk_size
+        self.mode = mode
+        self.files = None
+
+    def open(self, sampler):
+        """
+        open the files for `sampler`, creating them at first if mode is "w"
+
+        Parameters
+        ----------
+        sampler: ReplicaExchangeBase
+        """
+        row_shapes = {
+            name: getattr(sampler.storage, name).shape[:1] + getattr(sampler.storage, name).shape[2:]
+            for name in HISTORY
+        }
+        meta_path = os.path.join(self.path, "meta.json")
+        if self.mode == "w":
+            os.makedirs(self.path, exist_ok=True)
+            self.write_meta(sampler)
+            for name in HISTORY:
+                open(os.path.join(self.path, f"{name}.bin"), mode="wb").close()
+            # further calls of `sampling` continue the same history
+            self.mode = "a"
+        else:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if any(tuple(meta["shape"].get(name, ())) != row_shapes[name] for name in HISTORY):
+                raise ValueError(
+                    f"history in {self.path} does not match the sampler: {meta['shape']}"
+                )
+            # keep the rows the sampler has already dropped from memory, e.g. before
+            # its checkpoint, and remove the rows written after that
+            n_rows = sampler.storage.n_discarded
+            for name in HISTORY:
+                row_size = int(np.prod(meta["shape"][name])) * np.dtype(meta["dtype"][name]).itemsize
+                file_name = os.path.join(self.path, f"{name}.bin")
+                if os.path.getsize(file_name) < n_rows * row_size:
+                    raise ValueError(
+                        f"history in {self.path} is shorter than {n_rows} rows"
+                    )
+                os.truncate(file_name, n_rows * row_size)
+        self.files = {
+            name: open(os.path.join(self.path, f"{name}.bin"), mode="ab")
+            for name in HISTORY
+        }
+
+    def write_meta(self, sampler):
+        """
+        write the settings of `sampler` to `meta.json`, e.g. again after `eps_j_k` is tuned
+
+        Parameters
+        ----------
+        sampler: ReplicaExchangeBase
+        """
+        with open(os.path.join(self.path, "meta.json"), mode="w") as f:
+            json.dump({
+                "param_name_j": list(sampler.param_name_j),
+                "beta_k": np.asarray(sampler.beta_k, dtype=np.float64).tolist(),
+                "eps_j_k": np.asarray(sampler.eps_j_k, dtype=np.float64).tolist(),
+                "exchange_step": sampler.exchange_step,
+                "n_chain": sampler.n_chain,
+                "record_k": sampler.record_k.tolist(),
+                "n_tune": sampler.n_tune,
+                "shape": {
+                    name: list(getattr(sampler.storage, name).shape[:1] + getattr(sampler.storage, name).shape[2:])
+                    for name in HISTORY
+                },
+                "dtype": {name: np.dtype(dtype).str for name, dtype in HISTORY.items()},
+            }, f, indent=1)
+
+    def write(self, storage, n_rows):
+        """
+        append the first `n_rows` rows of `storage`
+
+        Parameters
+        ----------
+        storage: SampleStorage
+        n_rows: int
+        """
+        for name, f in self.files.items():
+            array = getattr(storage, name)[:, :n_rows]
+            f.write(np.ascontiguousarray(array.swapaxes(0, 1), dtype=HISTORY[name]).tobytes())
+            f.flush()
+
+    def close(self):
+        """close the files"""
+        if self.files is not None:
+            for f in self.files.values():
+                f.close()
+            self.files = None
+
+
+def read_chunks(path):
+    """
+    read the history written by `ChunkSink`
+
+    Parameters
+    ----------
+    path: str
+        directory of the history
+
+    Returns
+    -------
+    meta: dict
+        settings of the sampler
+    history: dict[str, np.ndarray]
+        (K, N, ...) views of memmap, trimmed to the rows written completely
+    """
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+    # histories written before `walker_n_k` was added lack it
+    names = [name for name in HISTORY if name in meta["shape"]]
+    row_size = {
+        name: int(np.prod(meta["shape"][name])) * np.dtype(meta["dtype"][name]).itemsize
+        for name in names
+    }
+    file_size = {
+        name: os.path.getsize(os.path.join(path, f"{name}.bin"))
+        for name in names
+    }
+    # rows written in all files, an unfinished chunk is ignored
+    n_rows = min(
+        file_size[name] // row_size[name]
+        for name in names if row_size[name]
+    )
+    history = {}
+    for name in names:
+        shape = (n_rows, *meta["shape"][name])
+        if n_rows == 0 or row_size[name] == 0:
+            array = np.zeros(shape, dtype=meta["dtype"][name])
+        else:
+            array = np.memmap(
+                os.path.join(path, f"{name}.bin"), dtype=meta["dtype"][name],
+                mode="r", shape=shape)
+        history[name] = array.swapaxes(0, 1)
+    return meta, history
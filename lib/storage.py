@@ -0,0 +1,159 @@
+import numpy as np
+
+
+class SampleStorage(object):
+    """
+    preallocated sample history of replica exchange
+
+    Every history is kept in a contiguous array which is allocated in chunks,
+    and exposed as zero-copy views trimmed to the number of stored rows.
+    """
+    def __init__(self, n_temp, n_dim, capacity=0, chunk_size=4096, n_record=None):
+        """
+        Parameters
+        ----------
+        n_temp: int
+            number of temperatures (K)
+        n_dim: int
+            number of parameters (J)
+        capacity: int, default=0
+            number of rows to allocate at first
+        chunk_size: int, default=4096
+            minimum number of rows to add when the arrays are extended
+        n_record: int, optional
+            number of replicas whose params and M-H acceptances are kept,
+            all replicas if None
+        """
+        self.n_temp = n_temp
+        self.n_dim = n_dim
+        self.n_record = n_temp if n_record is None else n_record
+        self.chunk_size = chunk_size
+        self.length = 0
+        # number of rows dropped from the front by `discard`
+        self.n_discarded = 0
+        self._sample_j_n_k = np.empty((self.n_record, 0, n_dim), dtype=np.float64)
+        self._lcp_sample_n_k = np.empty((n_temp, 0), dtype=np.float64)
+        self._lpp_sample_n_k = np.empty((n_temp, 0), dtype=np.float64)
+        self._ll_sample_n_k = np.empty((n_temp, 0), dtype=np.float64)
+        self._accept_j_n_k = np.empty((self.n_record, 0, n_dim), dtype=np.int8)
+        self._exchange_accept_n_k = np.empty((max(n_temp - 1, 0), 0), dtype=np.int8)
+        self._walker_n_k = np.empty((n_temp, 0), dtype=np.int16)
+        self.reserve(capacity)
+
+    @property
+    def capacity(self):
+        """number of allocated rows"""
+        return self._ll_sample_n_k.shape[1]
+
+    def reserve(self, n_rows):
+        """
+        make sure that at least `n_rows` rows are allocated
+
+        Parameters
+        ----------
+        n_rows: int
+            total number of rows needed
+        """
+        if n_rows <= self.capacity:
+            return
+        n_add = max(n_rows - self.capacity, self.chunk_size)
+        capacity = self.capacity + n_add
+        for name in (
+            "_sample_j_n_k", "_lcp_sample_n_k", "_lpp_sample_n_k",
+            "_ll_sample_n_k", "_accept_j_n_k", "_exchange_accept_n_k", "_walker_n_k"
+        ):
+            old = getattr(self, name)
+            new = np.empty(
+                (old.shape[0], capacity, *old.shape[2:]), dtype=old.dtype)
+            new[:, :self.length] = old[:, :self.length]
+            setattr(self, name, new)
+
+    def extend(self, n_rows):
+        """
+        append `n_rows` rows and return the index of the first one
+
+        Values of the new rows are undefined until they are written.
+
+        Parameters
+        ----------
+        n_rows: int
+            number of rows to append
+
+        Returns
+        -------
+        int
+            index of the first appended row
+        """
+        n_start = self.length
+        self.reserve(self.length + n_rows)
+        self.length += n_rows
+        return n_start
+
+    def discard(self, n_rows):
+        """
+        drop the first `n_rows` rows, e.g. after they are written to disk
+
+        The remaining rows are moved to the front, and the allocation is kept.
+
+        Parameters
+        ----------
+        n_rows: int
+            number of rows to drop
+        """
+        n_rows = min(n_rows, self.length)
+        for name in (
+            "_sample_j_n_k", "_lcp_sample_n_k", "_lpp_sample_n_k",
+            "_ll_sample_n_k", "_accept_j_n_k", "_exchange_accept_n_k", "_walker_n_k"
+        ):
+            array = getattr(self, name)
+            array[:, :self.length - n_rows] = array[:, n_rows:self.length].copy()
+        self.length -= n_rows
+        self.n_discarded += n_rows
+
+    def truncate(self, n_rows):
+        """
+        keep only the first `n_rows` rows, dropping the later ones without counting them
+        in `n_discarded` (they are not recorded anywhere)
+
+        Parameters
+        ----------
+        n_rows: int
+            number of rows to keep
+        """
+        self.length = min(self.length, n_rows)
+
+    @property
+    def sample_j_n_k(self):
+        """sampled params of recorded replicas, (K_record, N, J) view"""
+        return self._sample_j_n_k[:, :self.length]
+
+    @property
+    def lcp_sample_n_k(self):
+        """log conditional probabilities, (K, N) view"""
+        return self._lcp_sample_n_k[:, :self.length]
+
+    @property
+    def lpp_sample_n_k(self):
+        """log prior probabilities, (K, N) view"""
+        return self._lpp_sample_n_k[:, :self.length]
+
+    @property
+    def ll_sample_n_k(self):
+        """tempered log posterior probabilities, (K, N) view"""
+        return self._ll_sample_n_k[:, :self.length]
+
+    @property
+    def accept_j_n_k(self):
+        """acceptance of M-H step (1/0, -1 at exchange step) of recorded replicas, (K_record, N, J) view"""
+        return self._accept_j_n_k[:, :self.length]
+
+    @property
+    def exchange_accept_n_k(self):
+        """acceptance of exchange (1/0, -1 at M-H step), (K-1, N) view"""
+        return self._exchange_accept_n_k[:, :self.length]
+
+    @property
+    def walker_n_k(self):
+        """walker at each replica, (K, N) view"""
+        return self._walker_n_k[:, :self.length]
+
@@ -11,3 +11,14 @@ def multimodal_function(X: list[f8]) -> f8:
 @njit("f8(f8[:])")
 def target_function(X: list[f8]) -> f8:
     return - multimodal_function(X)
+
+@njit("f8[:](f8[:, :])")
+def target_function_batch(X_k: list[list[f8]]) -> list[f8]:
+    r_k = np.empty(X_k.shape[0])
+    for k in range(X_k.shape[0]):
+        r_k[k] = target_function(X_k[k])
+    return r_k
+
+@njit("f8(f8, i8)")
+def target_function_term(x: f8, j: i8) -> f8:
+    return - (x ** 4 - 16 * x ** 2 + 0.2 * x) / 2
@@ -0,0 +1,73 @@
+"""
+wall-clock effective sample size per second of the synchronous cycles of `sampling`
+against `asynchronous=True`, for a model whose cost varies (e.g. an external solver),
+simulated by sleeping
+
+Both modes give the same samples, so that the ratio of ESS/s is that of the time.
+"jitter": the cost of each call is random, and the slowest replica of a cycle changes
+from cycle to cycle, which the synchronous cycles wait for every time.
+"tails": the cost grows in the tails, so that hot replicas are always the slowest
+and bound the time of both modes.
+"""
+import os
+import random
+import sys
+import time
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../lib/'))
+from kernel import VectorSampling
+
+COST = "jitter"
+
+def target_function(X):
+    """gauss, whose cost is random (`COST` "jitter") or grows in the tails ("tails")"""
+    if COST == "jitter":
+        time.sleep(5e-3 * random.expovariate(1))
+    else:
+        time.sleep(2e-4 * (1 + X[0]**2))
+    return -(X**2).sum() / 2
+
+def effective_sample_size(x_n):
+    """ESS by the initial positive sequence of Geyer"""
+    x_n = x_n - x_n.mean()
+    n = x_n.size
+    acf = np.fft.irfft(np.abs(np.fft.rfft(x_n, 2 * n))**2)[:n] / (x_n.var() * n)
+    tau = -1.
+    for t in range(0, n - 1, 2):
+        pair = acf[t] + acf[t + 1]
+        if pair < 0:
+            break
+        tau += 2 * pair
+    return n / tau
+
+def ess_per_second(asynchronous, n_temp=8, n_samples=1000, dim=1):
+    """ESS of the coldest replica per second"""
+    beta_k = np.logspace(-2, 0, n_temp)
+    sp = VectorSampling(
+        dimention=dim,
+        log_likelifood_function=target_function,
+        beta_k=beta_k,
+        eps_j_k=[[2.4 / np.sqrt(beta) for _ in range(dim)] for beta in beta_k],
+        exchange_step=10,
+        prior_center=[0 for _ in range(dim)],
+        prior_width=[10 for _ in range(dim)],
+        init=[{f"x_{i}": 1. for i in range(dim)} for _k in beta_k],
+        n_workers=n_temp,
+        random_state=42
+    )
+    sp.sampling(sp.exchange_step + 1, verbose=False)  # compile
+    start = time.perf_counter()
+    sp.sampling(n_samples, verbose=False, asynchronous=asynchronous)
+    elapsed = time.perf_counter() - start
+    return effective_sample_size(sp.sample_j_n_k[-1, sp.exchange_step + 1:, 0]) / elapsed, elapsed
+
+if __name__=="__main__":
+    print(f"cpu: {os.cpu_count()}")
+    print("cost".ljust(8) + "mode".ljust(14) + f"{'time (s)':>10}{'ESS/s':>10}")
+    for COST in ("jitter", "tails"):
+        for asynchronous in (False, True):
+            ess, elapsed = ess_per_second(asynchronous)
+            print(
+                COST.ljust(8) + ("asynchronous" if asynchronous else "synchronous").ljust(14)
+                + f"{elapsed:10.2f}{ess:10.1f}")
@@ -0,0 +1,68 @@
+"""
+cost of random numbers in M-H steps, scalar calls against blocks drawn at once (`draw_steps`),
+and throughput of each engine for a cheap target, where the random numbers dominate
+"""
+import os
+import sys
+import time
+import numpy as np
+from numba import njit, f8
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../lib/'))
+from kernel import VectorSampling
+
+@njit("f8(f8[:])")
+def target_function(X: list[f8]) -> f8:
+    """gauss, almost free to evaluate"""
+    r = 0.
+    for x in X:
+        r += x * x
+    return -r / 2
+
+def target_function_batch(X_k):
+    return -(X_k**2).sum(axis=1) / 2
+
+def draw_cost(n_dim=3, n_steps=10**5):
+    """seconds per step to draw the proposal and uniform variates of all coordinates"""
+    rng = np.random.default_rng(0)
+    eps_j = np.full(n_dim, 0.5)
+    start = time.perf_counter()
+    for _ in range(n_steps):
+        for j in range(n_dim):
+            step = rng.normal(0, eps_j[j])
+            accept = rng.random() <= np.exp(-step * step)
+    scalar = (time.perf_counter() - start) / n_steps
+    start = time.perf_counter()
+    step_j_s = rng.standard_normal((n_steps, n_dim)) * eps_j
+    log_u_j_s = np.log(rng.random((n_steps, n_dim)))
+    accept_j_s = log_u_j_s < -step_j_s * step_j_s
+    block = (time.perf_counter() - start) / n_steps
+    return scalar, block
+
+def throughput(engine, n_temp=8, n_samples=2000, dim=3):
+    """samples per second of all replicas"""
+    beta_k = np.logspace(-3, 0, n_temp)
+    sp = VectorSampling(
+        dimention=dim,
+        log_likelifood_function=target_function,
+        beta_k=beta_k,
+        eps_j_k=[[0.5 for _ in range(dim)] for _k in beta_k],
+        exchange_step=20,
+        prior_center=[0 for _ in range(dim)],
+        prior_width=[10 for _ in range(dim)],
+        init=[{f"x_{i}": 1. for i in range(dim)} for _k in beta_k],
+        engine=engine,
+        batch_log_likelifood_function=target_function_batch if engine == "vectorized" else None,
+        random_state=42
+    )
+    sp.sampling(sp.exchange_step + 1, verbose=False)  # compile
+    start = time.perf_counter()
+    sp.sampling(n_samples, verbose=False)
+    return (sp.loop_count - sp.exchange_step - 1) * n_temp / (time.perf_counter() - start)
+
+if __name__=="__main__":
+    scalar, block = draw_cost()
+    print(f"random numbers of a step (3 coordinates): scalar {scalar*1e6:.2f} us, block {block*1e6:.3f} us")
+    print("engine".ljust(12) + f"{'samples/s':>12}")
+    for engine, n_samples in (("python", 2000), ("numba", 50000), ("vectorized", 20000)):
+        print(engine.ljust(12) + f"{throughput(engine, n_samples=n_samples):12.0f}")
@@ -0,0 +1,56 @@
+"""
+throughput of multithreaded replica updates (`n_threads`)
+against the number of threads and temperatures
+"""
+import os
+import sys
+import time
+import numpy as np
+from numba import njit, f8
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../lib/'))
+from kernel import VectorSampling
+
+N_DATA = 2000
+X_DATA = np.linspace(-5, 5, N_DATA)
+Y_DATA = 1.5 * np.sin(0.8 * X_DATA) + 0.3 * X_DATA + np.random.default_rng(0).normal(0, 0.5, N_DATA)
+
+@njit("f8(f8[:])", nogil=True)
+def target_function(X: list[f8]) -> f8:
+    """gauss noise likelihood of a curve fit, heavy enough for threads to pay off"""
+    r = 0.
+    for i in range(X_DATA.size):
+        d = Y_DATA[i] - X[0] * np.sin(X[1] * X_DATA[i]) - X[2] * X_DATA[i]
+        r += d * d
+    return -r / 2 / 0.5**2
+
+def throughput(n_temp, n_threads, n_samples=200, dim=3):
+    """samples per second of all replicas"""
+    beta_k = np.logspace(-3, 0, n_temp)
+    sp = VectorSampling(
+        dimention=dim,
+        log_likelifood_function=target_function,
+        beta_k=beta_k,
+        eps_j_k=[[0.05 for _ in range(dim)] for _k in beta_k],
+        exchange_step=20,
+        prior_center=[0 for _ in range(dim)],
+        prior_width=[10 for _ in range(dim)],
+        init=[{f"x_{i}": 1. for i in range(dim)} for _k in beta_k],
+        engine="numba",
+        n_threads=n_threads,
+        random_state=42
+    )
+    sp.sampling(sp.exchange_step + 1, verbose=False)  # compile
+    start = time.perf_counter()
+    sp.sampling(n_samples, verbose=False)
+    return (sp.loop_count - sp.exchange_step - 1) * n_temp / (time.perf_counter() - start)
+
+if __name__=="__main__":
+    n_cpu = os.cpu_count()
+    threads_list = sorted({1, 2, 4, 8, 16, 32, n_cpu} & set(range(1, n_cpu + 1)))
+    print(f"cpu: {n_cpu}, data: {N_DATA}")
+    print("n_temp".ljust(8) + "".join(f"{f'{t} thr':>12}" for t in threads_list) + "   (samples/s)")
+    for n_temp in (8, 16, 32):
+        print(
+            f"{n_temp}".ljust(8)
+            + "".join(f"{throughput(n_temp, t):12.0f}" for t in threads_list))